@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2019 Yorik van Havre <yorik@uncreated.net>              *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+
+# Homepage: https://github.com/opensourceBIM/BIMbots-FreeCAD
+
+"""Benchmarks for the bimbots module. Run from the command line with
+python benchmarks.py, or import and call the individual functions.
+They don't need network access nor FreeCAD."""
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import random
+import subprocess
+
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_test_results():
+
+    "Returns the contents of the test payload response shipped with the plugin"
+
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)),"testfiles","test payload response.json")) as json_file:
+        return json.load(json_file)
+
+
+def benchmark_aggregation(count=1000,types=40,storeys=10):
+
+    """Aggregates count analytics results (with the given number of IFC types and storeys each,
+    spread over 20 models) and prints the time spent ingesting and computing statistics"""
+
+    import bimbots
+    template = get_test_results()
+    random.seed(0)
+    results = []
+    for i in range(count):
+        result = json.loads(json.dumps(template))
+        result['aggregations']['perType'] = dict([("IfcType"+str(t),{"numberOfObjects":random.randint(0,500),
+                                                                     "averageNumberOfPsets":random.random()*10,
+                                                                     "averageNumberOfProperties":random.random()*50})
+                                                  for t in range(types)])
+        result['project']['sites'][0]['buildings'][0]['storeys'] = [{"name":"Storey "+str(s),
+                                                                     "guid":"G"+str(s),
+                                                                     "totalNumberOfObjects":random.randint(0,1000),
+                                                                     "spaces":[]}
+                                                                    for s in range(storeys)]
+        results.append(result)
+
+    aggregator = bimbots.results_aggregator()
+    start = time.time()
+    for i, result in enumerate(results):
+        aggregator.add(result,i,"model"+str(i%20),float(i))
+    ingest = time.time() - start
+    start = time.time()
+    per_type = aggregator.group_stats(by=("group","metric"),path="/aggregations/perType")
+    per_storey = aggregator.group_stats(by=("model","group"),metric="totalNumberOfObjects")
+    stats = time.time() - start
+    start = time.time()
+    trend = aggregator.trend("numberOfObjects",model="model0")
+    trends = time.time() - start
+    print("Aggregation of",count,"results,",len(aggregator),"values:")
+    print("  ingest:     %.3f s" % ingest)
+    print("  group-bys:  %.3f s (%d per type rows, %d per storey rows)" % (stats,len(per_type),len(per_storey)))
+    print("  trend:      %.3f s (%d runs)" % (trends,len(trend)))
+
+
+def benchmark_startup(budget=0.1,runs=5):
+
+    """Imports bimbots in fresh Python processes and prints the best import time against the given
+    budget in seconds. Also checks that the network stack (requests) was not imported."""
+
+    code = ("import sys, time; start = time.time(); import bimbots; "
+            "print(time.time() - start); print('requests' in sys.modules)")
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.path.dirname(os.path.abspath(__file__))
+    times = []
+    loaded = False
+    for i in range(runs):
+        output = subprocess.check_output([sys.executable,"-c",code],env=env).decode().split()
+        times.append(float(output[0]))
+        loaded = loaded or (output[1] == "True")
+    best = min(times)
+    print("Startup (import bimbots), best of",runs,"runs:")
+    print("  import:     %.3f s (budget %.3f s) %s" % (best,budget,"OK" if best <= budget else "OVER BUDGET"))
+    print("  requests imported at startup:",loaded)
+    return best <= budget and not loaded
+
+
+if __name__ == "__main__":
+    benchmark_startup()
+    benchmark_aggregation()
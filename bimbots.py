@@ -37,10 +37,36 @@ from __future__ import print_function # this code is compatible with python 2 an
 
 import os
 import sys
+import time
 import tempfile
-import requests
+import hashlib
 import json
 
+
+
+class lazy_module(object):
+
+    """A stand-in for a module that is only imported when one of its attributes is first used.
+    This keeps the network stack and other heavy modules out of the startup time."""
+
+    def __init__(self,name):
+
+        self.__dict__['name'] = name
+        self.__dict__['module'] = None
+
+    def __getattr__(self,attr):
+
+        if self.module is None:
+            import importlib
+            self.__dict__['module'] = importlib.import_module(self.name)
+        return getattr(self.module,attr)
+
+
+requests = lazy_module("requests")
+sqlite3 = lazy_module("sqlite3")
+zipfile = lazy_module("zipfile")
+
+
 # python2 / python3 compatibility tweaks
 if sys.version_info.major < 3:
     # Python 2
@@ -65,16 +91,31 @@ else:
 CONFIG_FILE = os.path.join(os.path.expanduser("~"),".BIMbots") # A file to store authentication tokens
 if sys.platform.lower().startswith("win"):
     CONFIG_FILE = os.path.join(os.environ['APPDATA'], 'BIMbots.cfg') # use something nicer on windows
+HISTORY_FILE = os.path.splitext(CONFIG_FILE)[0]+".db" # A SQLite database to store the results of past runs
+CACHE_FILE = os.path.splitext(CONFIG_FILE)[0]+".cache" # A file to store the last known providers and services
 DEBUG = False # If True, debug messages are printed, and test items are added to the UI. If not, everything happens (and fails) silently
 DECAMELIZE = True # if True, variable names appear de-camelized in results
+TIMINGS_WINDOW = 50 # the number of request durations kept in the history for each service (see record_timing())
 
 # the following values can be overwritten in the config file:
 SERVICES_URL = "https://raw.githubusercontent.com/opensourceBIM/BIMserver-Repository/master/serviceproviders.json"
-CONNECTION_TIMEOUT = 5 # connection timeout, in seconds
+CONNECTION_TIMEOUT = 5 # connection timeout, in seconds. Used until enough requests have been timed, and as the maximum connection timeout
+MIN_TIMEOUT = 1 # the lowest timeout, in seconds, given to a request
+MAX_TIMEOUT = 600 # the highest timeout, in seconds, given to a request, and the timeout of payloads sent to services that have no history yet
+TIMEOUT_FACTOR = 3 # timeouts are this number of times the duration expected from the history of the service
+MAX_CONCURRENCY = 4 # the highest number of requests sent at the same time to a service, whatever its history
 CLIENT_NAME = "FreeCAD"
 CLIENT_DESCRIPTION = "The FreeCAD BIMbots plugin"
 CLIENT_URL = "https://github.com/opensourceBIM/BIMbots-FreeCAD"
 CLIENT_ICON = "https://www.freecadweb.org/images/logo.png" #bimserver doesn't seem to like this image... Why, OH WHY?
+KEEP_HISTORY = True # if True, every result obtained from a service is stored in the history database
+MAX_JOBS = 2 # the maximum number of jobs of the job queue sent at the same time
+SCRATCH_DIR = None # where exported IFC files and received BCF files are written. A tmpfs is a good choice. If None, a BIMbots folder in the system temp dir
+SCRATCH_QUOTA = 1024 # maximum size of the scratch directory, in MB. The least recently used files are deleted above that
+SPECULATIVE_DELAY = 5 # when background export is enabled, number of seconds the document must stay unchanged before it is exported
+SPLIT_WORKERS = 4 # the maximum number of parts of a split model sent at the same time to split-safe services
+SHARED_CACHE = None # a shared cache server url, or a shared directory, where results are looked for before sending a model. If None, no shared cache is used
+SHARED_CACHE_TOKEN = None # the token sent to the shared cache server, for services that have no cache_token of their own
 
 # detect if we're running inside FreeCAD
 try:
@@ -103,10 +144,22 @@ def read_config():
     #   {
     #      "default_services_url": "https://server.com/serviceproviders.json", # a json giving urls of service providers
     #      "connection_timeout": 5, # the timeout when trying to connect to online services
+    #      "min_timeout": 1, # the lowest timeout derived from the history of a service
+    #      "max_timeout": 600, # the highest timeout derived from the history of a service
+    #      "timeout_factor": 3, # the margin between the expected duration of a request and its timeout
+    #      "max_concurrency": 4, # the highest number of requests sent at the same time to a service
     #      "client_name": "FreeCAD", # the name under which this application will be known by BIMServers
     #      "client_description": "The best BIM app out there", # a description shown on BIMServers authentication pages and user settings
     #      "client_icon": "https://server.com/image.png",  # a PNG icon for this application
     #      "client_url": "https://myserver.comg",  # a URL for this application, shown on BIMservers
+    #      "keep_history": true,  # if results should be stored in the history database
+    #      "max_jobs": 2,  # the maximum number of queued jobs sent at the same time
+    #      "scratch_dir": "/tmp/BIMbots",  # where temporary IFC and BCF files are written, null to use the system temp dir
+    #      "scratch_quota": 1024,  # the maximum size of the scratch dir in MB
+    #      "speculative_delay": 5,  # idle seconds before the model is exported in the background, if enabled in the panel
+    #      "split_workers": 4,  # the maximum number of parts of a split model sent at the same time
+    #      "shared_cache": "http://cache.myteam.com:8090",  # a shared cache server or directory, null if none
+    #      "shared_cache_token": "XXXXXXXXXXX",  # the token given to the shared cache server
     #   },
     #   "providers" :
     #   [
@@ -121,6 +174,8 @@ def read_config():
     #       "provider_url": "http://localhost:8082/services", # the listUrl of the server returned by get_service_providers (ie. one by server)
     #       "service_url": "http://localhost:8082/services/3014734", # the specific URL given by the auth procedure. Only present if authenticated
     #       "token": "XXXXXXXXXXX", # the token  given by the auth procedure. Only present if authenticated
+    #       "split_safe": true, # optional. If true, models are split by storey and the parts are sent in parallel
+    #       "cache_token": "XXXXXXXXXXX", # optional. The token given to the shared cache server for this service
     #     }, ...
     #   ]
     # }
@@ -205,7 +260,7 @@ def save_default_config():
     "Saves the default settings to the config file. Returns nothing"
 
     config = read_config()
-    for setting in ["default_services_url","connection_timeout","client_name","client_description","client_icon","client_url"]:
+    for setting in ["default_services_url","connection_timeout","min_timeout","max_timeout","timeout_factor","max_concurrency","client_name","client_description","client_icon","client_url","keep_history","max_jobs","scratch_dir","scratch_quota","speculative_delay","split_workers","shared_cache","shared_cache_token"]:
         config['config'][setting] = globals()[setting.upper()]
     save_config(config)
 
@@ -275,7 +330,7 @@ def get_service_providers(autodiscover=True,url=None):
     if not autodiscover:
         return providers
     try:
-        response = requests.get(url,timeout=get_config_value("connection_timeout"))
+        response = send_request("GET",url)
     except:
         if DEBUG:
             print("Error: unable to connect to service providers list at",url)
@@ -305,7 +360,7 @@ def get_services(list_url):
     "Returns a list of dicts of service plugins available from a given service provider list url"
 
     try:
-        response = requests.get(list_url,timeout=get_config_value("connection_timeout"))
+        response = send_request("GET",list_url)
     except:
         if DEBUG:
             print("Error: unable to connect to service provider at",list_url)
@@ -424,9 +479,21 @@ def beautyprint(data):
     print(data)
 
 
-def send_ifc_payload(provider_url,service_id,file_path):
+def is_number(value):
+
+    "Returns True if the given value is an int or a float (booleans are not numbers here)"
 
-    "Sends a given IFC file to the given service. Returns the json response as a dict"
+    return isinstance(value,(int,float)) and not isinstance(value,bool)
+
+
+def send_ifc_payload(provider_url,service_id,file_path,context_id=None,info=None,record=True):
+
+    """Sends a given IFC file to the given service. Returns the json response as a dict.
+    If a context_id is given, it is sent as Context-Id header. If an info dict is given, it receives
+    the Context-Id returned by the server (context_id) and the id of the run in the history (run_id).
+    If record is False, the results are not stored in the history. If a shared cache is set, results
+    found there are returned without contacting the service (and info receives cached = True), and
+    results obtained from the service are stored there"""
 
     service = get_service_config(provider_url,service_id)
     if DEBUG:
@@ -437,8 +504,8 @@ def send_ifc_payload(provider_url,service_id,file_path):
             "Token": service['token'],
             "Accept-Flow": "SYNC,ASYNC_WS" # preferred workflow - To be tested
         }
-        #if "Context-Id" in service: # this model has already been uploaded before. TODO - This should be stored per model, not per service
-        #    headers['Context-Id'] = service['Context-Id']
+        if context_id: # this model has already been uploaded before
+            headers['Context-Id'] = context_id
         if os.path.exists(file_path):
             with open(file_path) as file_stream:
                 data = file_stream.read()
@@ -446,16 +513,28 @@ def send_ifc_payload(provider_url,service_id,file_path):
             if DEBUG:
                 print("Error: unable to load payload IFC file from",file_path,". Aborting")
             return {}
+        cached = get_shared_results(provider_url,service_id,data)
+        if cached:
+            if DEBUG:
+                print("Results found in the shared cache")
+            run_id = record_run(provider_url,service_id,data,cached) if record else None
+            if info is not None:
+                info['run_id'] = run_id
+                info['cached'] = True
+            return cached
+        start = time.time()
         try:
-            response = requests.post(service['service_url'],headers=headers,data=data,timeout=get_config_value("connection_timeout"))
+            response = send_request("POST",service['service_url'],len(data),headers=headers,data=data)
         except:
             if DEBUG:
                 print("Error: unable to connect to service provider at",service['service_url'])
             return {}
+        duration = time.time() - start
+        if info is not None:
+            info['context_id'] = response.headers.get("Context-Id")
         if response.ok:
             try:
                 res = response.json()
-                # TODO get headers too, get Context-Id
             except:
                 try:
                     text = response.content
@@ -465,11 +544,19 @@ def send_ifc_payload(provider_url,service_id,file_path):
                         print("Error: unable to read response from service",service_id,"at",service['service_url'])
                     return None
                 else:
+                    store_shared_results(provider_url,service_id,data,text)
+                    run_id = record_run(provider_url,service_id,data,text,duration) if record else None
+                    if info is not None:
+                        info['run_id'] = run_id
                     return text
             else:
                 if ("message" in res) and ("error" in res['message'].lower()) and ("code" in res):
                     print("This payload has been rejected by the server, with the following error: Error code",res['code'],":",res['message'])
                     return {}
+                store_shared_results(provider_url,service_id,data,res)
+                run_id = record_run(provider_url,service_id,data,res,duration) if record else None
+                if info is not None:
+                    info['run_id'] = run_id
                 return res
         else:
             if DEBUG:
@@ -497,452 +584,3652 @@ def get_plugin_info():
             'ToolTip' : "Launches the BIMBots tool"}
 
 
-#############   FreeCAD UI panel
+#############   Scratch space - temporary IFC and BCF files
 
 
-def launch_ui():
+class scratch_space:
 
-    "Opens the BIMbots task panel in FreeCAD"
+    """A directory where temporary payloads and results are written, with a size quota. When the quota
+    is exceeded, the least recently used files are deleted. Exported models can be stored under a key
+    so the same export is reused by the next run instead of being exported again."""
 
-    FreeCADGui.Control.showDialog(bimbots_panel())
+    def __init__(self,path=None,quota=None):
 
+        self.path = path or get_config_value("scratch_dir") or os.path.join(tempfile.gettempdir(),"BIMbots")
+        self.quota = (quota or get_config_value("scratch_quota")) * 1024 * 1024
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
 
-class bimbots_panel:
+    def new_file(self,suffix="",prefix="bimbots-"):
 
-    """This is the interface panel implementation of bimbots.ui. It is meant to run inside FreeCAD.
-    It is launched by the launch_ui() function"""
+        "Creates a new empty file in the scratch space. Returns its path"
 
-    def __init__(self):
+        fd, path = tempfile.mkstemp(suffix=suffix,prefix=prefix,dir=self.path)
+        os.close(fd)
+        return path
 
-        # this is to be able to cancel running progress
-        self.running = True
+    def write(self,data,suffix=""):
 
-        # locate and load available translations
-        FreeCADGui.addLanguagePath(os.path.join(os.path.dirname(__file__),"translations"))
+        "Writes the given data (bytes) to a new file in the scratch space, then enforces the quota. Returns the file path"
 
-        # load the ui file. Widgets re automatically named from the ui file
-        self.form = FreeCADGui.PySideUic.loadUi(os.path.join(os.path.dirname(__file__),"bimbots.ui"))
+        path = self.new_file(suffix)
+        with open(path,"wb") as new_file:
+            new_file.write(data)
+        self.cleanup(keep=[path])
+        return path
 
-        # set the logo and icon
-        self.form.setWindowIcon(QtGui.QIcon(os.path.join(os.path.dirname(__file__),"icons","BIM-Bots-validationchecker.png")))
-        logo = QtGui.QPixmap(os.path.join(os.path.dirname(__file__),"icons","BIM-Bots-header.png"))
-        w = self.form.servicesList.width()
-        h = int(w*0.2578)
-        self.form.labelLogo.setText("")
-        self.form.labelLogo.setPixmap(logo.scaled(w,h))
-        # hide the logo for now TODO : Do something better here...
-        self.form.labelLogo.hide()
+    def get_model_path(self,key,suffix=".ifc"):
 
-        # hide the collapsible parts
-        self.form.groupProgress.hide()
-        self.form.groupRescan.hide()
-        self.form.groupAddService.hide()
-        self.form.groupAuthenticate.hide()
-        self.form.groupResults.hide()
+        "Returns the path under which the export identified by the given key (any string) is stored, whether it exists or not"
 
-        # restore default settings
-        self.get_defaults()
+        return os.path.join(self.path,"model-"+hashlib.sha1(tostr(key).encode("utf8")).hexdigest()+suffix)
 
-        # connect buttons
-        self.form.buttonRescan.clicked.connect(self.form.groupRescan.show)
-        self.form.buttonDoRescan.clicked.connect(self.form.groupRescan.hide)
-        self.form.buttonDoRescan.clicked.connect(self.on_scan)
-        self.form.buttonCancelRescan.clicked.connect(self.form.groupRescan.hide)
-        self.form.buttonAddService.clicked.connect(self.form.groupAddService.show)
-        self.form.buttonRemoveService.clicked.connect(self.on_remove_service)
-        self.form.buttonSaveService.clicked.connect(self.on_add_service)
-        self.form.buttonCancelService.clicked.connect(self.form.groupAddService.hide)
-        self.form.buttonAuthenticate.clicked.connect(self.form.groupAuthenticate.show)
-        self.form.buttonAuthenticate.clicked.connect(self.on_authenticate)
-        self.form.buttonSaveAuthenticate.clicked.connect(self.on_save_authenticate)
-        self.form.buttonCancelAuthenticate.clicked.connect(self.form.groupAuthenticate.hide)
-        self.form.buttonRun.clicked.connect(self.on_run)
-        self.form.buttonCancelProgress.clicked.connect(self.on_cancel)
-        self.form.buttonCloseResults.clicked.connect(self.form.groupServices.show)
-        self.form.buttonCloseResults.clicked.connect(self.form.groupRun.show)
-        self.form.buttonCloseResults.clicked.connect(self.form.groupResults.hide)
+    def get_model_file(self,key,suffix=".ifc"):
 
-        # fields validation
-        self.form.lineEditServiceName.textChanged.connect(self.validate_fields)
-        self.form.lineEditServiceUrl.textChanged.connect(self.validate_fields)
-        self.form.lineEditAuthenticateUrl.textChanged.connect(self.validate_fields)
-        self.form.lineEditAuthenticateToken.textChanged.connect(self.validate_fields)
+        "Returns the path of a previous export stored under the given key, or None. Reused files are marked as recently used"
 
-        # connect services list
-        self.form.servicesList.currentItemChanged.connect(self.on_list_click)
-        self.form.scopeList.currentItemChanged.connect(self.on_list_click)
+        path = self.get_model_path(key,suffix)
+        if os.path.exists(path) and os.path.getsize(path):
+            os.utime(path,None)
+            return path
+        return None
 
-        # connect widgets that should remember their setting
-        self.form.checkAutoDiscover.stateChanged.connect(self.save_defaults)
-        self.form.checkShowUnreachable.stateChanged.connect(self.save_defaults)
+    def store_model_file(self,key,file_path,suffix=".ifc"):
 
-        # connect clickable links
-        self.form.treeResults.itemDoubleClicked.connect(self.on_click_results)
-        self.form.labelHelp.linkActivated.connect(self.on_click_help)
+        "Moves the given exported file into the scratch space under the given key, then enforces the quota. Returns the new path"
 
-        # perform initial scan after the UI has been fully drawn
-        QtCore.QTimer.singleShot(0,self.on_scan)
+        path = self.get_model_path(key,suffix)
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(file_path,path)
+        self.cleanup(keep=[path])
+        return path
 
-        # remove test items if needed
-        if not DEBUG:
-            self.form.scopeList.takeItem(5) # Test output only
-            self.form.scopeList.takeItem(4) # Test payload
-            self.form.scopeList.takeItem(3) # External IFC file
+    def get_size(self):
 
-    def getStandardButtons(self):
+        "Returns the total size of the files in the scratch space, in bytes"
 
-        "The list of buttons to show above the task panel. Returns a Close button only."
+        files = [os.path.join(self.path,f) for f in os.listdir(self.path)]
+        return sum([os.path.getsize(f) for f in files if os.path.isfile(f)])
 
-        return int(QtGui.QDialogButtonBox.Close)
+    def cleanup(self,keep=()):
 
-    def needsFullSpace(self):
+        "Deletes the least recently used files until the scratch space fits in its quota. Files in keep are never deleted. Returns nothing"
 
-        "Notifies FreeCAD that this panel needs max height. Returns True"
+        files = []
+        total = 0
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path,name)
+            if not os.path.isfile(path):
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((max(stat.st_mtime,stat.st_atime),stat.st_size,path))
+            total += stat.st_size
+        if total <= self.quota:
+            return
+        for used, size, path in sorted(files):
+            if path in keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            if DEBUG:
+                print("Removed scratch file",path)
+            total -= size
+            if total <= self.quota:
+                break
 
-        return True
 
-    def reject(self):
+def get_scratch_space():
 
-        """Called when the "Close" button of the task dialog is pressed, closes the panel. Returns nothing"""
+    "Returns the scratch_space configured in the config file"
 
-        FreeCADGui.Control.closeDialog()
-        if FreeCAD.ActiveDocument:
-            FreeCAD.ActiveDocument.recompute()
+    return scratch_space()
 
-    def on_scan(self):
 
-        "Scans for providers and services and updates the Available Services list. Returns nothing"
 
-        # clean the services list
-        self.form.servicesList.clear()
+#############   Service registry - in-memory records of known providers and services
 
-        # setup the progress bar
-        self.running = True
-        self.form.groupProgress.show()
-        self.form.progressBar.setFormat(translate("BIMBots","Getting services"))
 
-        # query services
-        providers = get_service_providers(autodiscover=self.form.checkAutoDiscover.isChecked())
-        self.form.progressBar.setValue(int(100/len(providers)))
-        n = 1
-        for provider in providers:
-            top = QtGui.QTreeWidgetItem(self.form.servicesList)
-            top.setText(0,provider['name'])
-            top.setIcon(0,QtGui.QIcon(os.path.join(os.path.dirname(__file__),"icons","Tango-Computer.svg")))
-            # store the whole provider dict
-            top.setData(0,QtCore.Qt.UserRole,json.dumps(provider))
-            top.setToolTip(0,provider['name'])
-            if "description" in provider:
-                if provider['description']:
-                    top.setToolTip(0,provider['description'])
-            if "custom" in provider:
-                top.setToolTip(0,top.toolTip(0)+" ("+translate("BIMBots","saved")+")")
-            else:
-                top.setToolTip(0,top.toolTip(0)+" ("+translate("BIMBots","autodiscovered")+")")
-            if self.running:
-                services = get_services(provider['listUrl'])
-                if services:
-                    for service in services:
-                        # services descriptions might contain a more accurate server name
-                        if ("provider" in service) and service['provider'] and (service['provider'] != top.text(0)):
-                            top.setText(0,service['provider'])
-                        child = QtGui.QTreeWidgetItem(top)
-                        child.setText(0,service['name'])
-                        # store the whole service dict
-                        child.setData(0,QtCore.Qt.UserRole,json.dumps(service))
-                        # construct tooltip with different pieces of data
-                        if "description" in service:
-                            child.setToolTip(0,service['description'])
-                        if "inputs" in service:
-                            child.setToolTip(0,child.toolTip(0)+"\n"+"inputs: "+",".join(service['inputs']))
-                        if "outputs" in service:
-                            child.setToolTip(0,child.toolTip(0)+"\n"+"outputs: "+",".join(service['outputs']))
-                        authenticated = get_service_config(provider['listUrl'],service['id'])
-                        if authenticated:
-                            child.setIcon(0,QtGui.QIcon(":/icons/button_valid.svg")) # FreeCAD builtin icon
-                            child.setToolTip(0,child.toolTip(0)+"\n"+translate("BIMBots","Authenticated"))
-                    top.setExpanded(True)
-                else:
-                    if self.form.checkShowUnreachable.isChecked():
-                        # show provider as disabled: remove Enabled from flags
-                        # This doesn't work well as it becomes unselectable and therefore not removable
-                        # top.setFlags(top.flags() & ~QtCore.Qt.ItemIsEnabled)
-                        # instead, paint it with the disabled color and show a daunting icon
-                        top.setIcon(0,QtGui.QIcon(":/icons/button_invalid.svg"))
-                        palette = QtGui.QApplication.palette()
-                        top.setForeground(0,palette.brush(palette.Disabled,palette.Text))
-                        top.setToolTip(0,top.toolTip(0)+" - "+translate("BIMBots","Unreachable"))
-                    else:
-                        # remove it from the list
-                        self.form.servicesList.takeTopLevelItem(self.form.servicesList.topLevelItemCount()-1)
-            self.form.progressBar.setValue(int(100*(n/len(providers))))
-            n += 1
+class provider_record(object):
 
-        # clean the progress bar
-        self.running = False
-        self.form.groupProgress.hide()
-        self.form.groupRescan.hide()
+    "A service provider, as found in the config file or autodiscovered"
 
+    __slots__ = ["list_url","name","description","custom","reachable","data"]
 
-    def on_list_click(self,arg1=None,arg2=None):
+    def __init__(self,data):
 
-        "Checks which items are selected and what options should be enabled. Args not used. Returns nothing"
+        self.list_url = data['listUrl']
+        self.reachable = None # unknown until its services are fetched
+        self.update(data)
 
-        # start by disabling everything
-        self.form.buttonRemoveService.setEnabled(False)
-        self.form.buttonAuthenticate.setEnabled(False)
-        self.form.buttonRun.setEnabled(False)
-        serviceitem = self.form.servicesList.currentItem()
-        scopeitem = self.form.scopeList.currentItem()
-        if scopeitem:
-            if scopeitem.text() == translate("BIMBots","Test output only"):
-                # this is a test item that doesn't send data toany service
-                self.form.buttonRun.setEnabled(True)
-        if serviceitem:
-            if serviceitem.parent():
-                # this is a service
-                self.form.buttonAuthenticate.setEnabled(True)
-                if translate("BIMBots","Authenticated") in serviceitem.toolTip(0):
-                    if scopeitem:
-                        self.form.buttonRun.setEnabled(True)
-            else:
-                # this is a provider
-                if 'custom' in json.loads(serviceitem.data(0,QtCore.Qt.UserRole)):
-                    self.form.buttonRemoveService.setEnabled(True)
+    def update(self,data):
 
-    def on_click_help(self,arg=None):
+        "Updates this record from a provider dict returned by get_service_providers(). Returns nothing"
 
-        "Opens a browser to show the BIMbots help page. Arg not used. Returns nothing"
+        self.name = data.get('name') or self.list_url
+        self.description = data.get('description')
+        self.custom = "custom" in data
+        self.data = data
 
-        url = "https://github.com/opensourceBIM/BIMbots-FreeCAD/blob/master/doc/ui-documentation.md"
-        err = "Error: Unable to launch web browser. Please paste the following URL in your web browser: " + url
-        try:
-            import webbrowser
-        except:
-            print(err)
-        else:
-            res = webbrowser.open(url)
-            if not res:
-                print(err)
 
-    def validate_fields(self,arg=None):
+class service_record(object):
 
-        "Validates the editable fields, turn buttons on/off as needed. Arg not used. Returns nothing"
+    "A service offered by a provider, with its capabilities and authentication state"
 
-        # disable everything first
-        self.form.buttonSaveService.setEnabled(False)
-        self.form.buttonSaveAuthenticate.setEnabled(False)
+    __slots__ = ["provider_url","id","name","description","provider","inputs","outputs","oauth","authenticated","data"]
 
-        if self.form.lineEditServiceName.text() and self.form.lineEditServiceUrl.text():
-            self.form.buttonSaveService.setEnabled(True)
+    def __init__(self,provider_url,data):
 
-        if self.form.lineEditAuthenticateUrl.text() and self.form.lineEditAuthenticateToken.text():
-            self.form.buttonSaveAuthenticate.setEnabled(True)
+        self.provider_url = provider_url
+        self.id = data['id']
+        self.authenticated = False
+        self.update(data)
 
-    def on_add_service(self):
+    def update(self,data):
 
-        "Adds a custom service provider and its services and updates the Available Services list. Returns nothing"
+        "Updates this record from a service dict returned by get_services(). Returns nothing"
 
-        name = self.form.lineEditServiceName.text()
-        url = self.form.lineEditServiceUrl.text()
-        if name and url:
-            save_custom_provider(name,url)
-            self.form.groupAddService.hide()
-            QtCore.QTimer.singleShot(0,self.on_scan)
+        self.name = data.get('name',"")
+        self.description = data.get('description')
+        self.provider = data.get('provider')
+        self.inputs = data.get('inputs') or []
+        self.outputs = data.get('outputs') or []
+        self.oauth = data.get('oauth') or {}
+        self.data = data
 
-    def on_remove_service(self):
+    @property
+    def key(self):
 
-        "Removes a custom service provider from the config. Returns nothing"
+        "The (provider list url, service id) tuple identifying this service"
 
-        serviceitem = self.form.servicesList.currentItem()
-        if serviceitem:
-            if not serviceitem.parent():
-                # this is a provider
-                name = serviceitem.text(0)
-                data = json.loads(serviceitem.data(0,QtCore.Qt.UserRole))
-                if 'custom' in data:
-                    reply = QtGui.QMessageBox.question(None,
-                                                       translate("BIMBots","Removal warning"),
-                                                       translate("BIMBots","Remove provider")+" \""+name+"\"? "+translate("BIMBots","This cannot be undone."),
-                                                       QtGui.QMessageBox.Yes | QtGui.QMessageBox.No,
-                                                       QtGui.QMessageBox.No)
-                    if reply == QtGui.QMessageBox.Yes:
-                        delete_custom_provider(data['listUrl'])
-                        QtCore.QTimer.singleShot(0,self.on_scan)
+        return (self.provider_url,self.id)
 
-    def on_authenticate(self):
+    @property
+    def identity(self):
 
-        "Opens a browser window to authenticate. Returns nothing"
+        "A tuple identifying the service itself, whatever the provider it is reached through: its name, description, inputs and outputs"
 
-        self.form.groupAuthenticate.show()
-        self.form.lineEditAuthenticateToken.clear()
-        self.form.lineEditAuthenticateUrl.clear()
-        serviceitem = self.form.servicesList.currentItem()
-        if serviceitem:
-            if serviceitem.parent():
-                # this is a service
-                service_data = json.loads(serviceitem.data(0,QtCore.Qt.UserRole))
-                if "oauth" in service_data:
-                    if "registerUrl" in service_data['oauth']:
-                        step1 = authenticate_step_1(service_data['oauth']['registerUrl'])
-                        if step1:
-                            auth_url = service_data['oauth']['authorizationUrl']
-                            client_id = step1['client_id']
-                            service_name = service_data['name']
-                            step2 = authenticate_step_2(auth_url,client_id,service_name)
-                            if step2 == True:
-                                return
-                            msg = translate("BIMBots","Unable to open a web browser. Please paste the following URL in your web browser")+": " + step2
-                            QtGui.QMessageBox.information(None,"Error",msg)
-        print("Error: Unable to start authentication!")
+        return (self.name.strip().lower(),(self.description or "").strip().lower(),tuple(self.inputs),tuple(self.outputs))
 
-    def on_save_authenticate(self):
+    def outputs_bcf(self):
 
-        "Authenticates with the selected service and updates the Available Services list. Returns nothing"
+        "Returns True if this service outputs BCF. Only the first output type is analyzed for now"
 
-        service_url = self.form.lineEditAuthenticateUrl.text()
-        token = self.form.lineEditAuthenticateToken.text()
-        if service_url and token:
-            serviceitem = self.form.servicesList.currentItem()
-            if serviceitem:
-                if serviceitem.parent():
-                    # this is a service
-                    provider_data = json.loads(serviceitem.parent().data(0,QtCore.Qt.UserRole))
-                    provider_url = provider_data['listUrl']
-                    service_data = json.loads(serviceitem.data(0,QtCore.Qt.UserRole))
-                    service_id = service_data['id']
-                    service_name = service_data['name']
-                    save_authentication(provider_url,service_id,service_name,service_url,token)
-                    self.form.groupAuthenticate.hide()
-                    QtCore.QTimer.singleShot(0,self.on_scan)
-                    return
-        print("Error: Unable to register authentication!")
+        return bool(self.outputs) and ("BCF" in self.outputs[0])
 
-    def on_run(self):
 
-        "Runs the selected service. Returns nothing"
+class service_registry:
 
-        results = None
-        serviceitem = self.form.servicesList.currentItem()
-        scopeitem = self.form.scopeList.currentItem()
-        service_data = None
-        if scopeitem:
-            if scopeitem.text() == "Test output only":
-                # Test item - don't run any service, just show dummy results from file
-                payload_response = os.path.join(os.path.dirname(__file__),"testfiles","test payload response.json")
-                if os.path.exists(payload_response):
-                    with open(payload_response) as json_file:
-                        results = json.load(json_file)
-            elif serviceitem:
-                if serviceitem.parent():
-                    # this is a service
-                    if translate("BIMBots","Authenticated") in serviceitem.toolTip(0):
-                        if scopeitem:
-                            # we have scope and authenticated service: let's run!
-                            self.running = True
-                            # setup the progress bar
-                            self.form.groupProgress.show()
-                            self.form.progressBar.setFormat(translate("BIMBots","Preparing"))
-                            self.form.progressBar.setValue(25)
-                            provider_data = json.loads(serviceitem.parent().data(0,QtCore.Qt.UserRole))
-                            provider_url = provider_data['listUrl']
-                            service_data = json.loads(serviceitem.data(0,QtCore.Qt.UserRole))
-                            service_id = service_data['id']
-                            if scopeitem.text() == translate("BIMBots","Test payload"):
-                                # no need to check for current document if running a test payload
-                                self.form.progressBar.setFormat(translate("BIMBots","Sending data"))
-                                self.form.progressBar.setValue(75)
-                                results = send_test_payload(provider_url,service_id)
-                            elif scopeitem.text() == translate("BIMBots","Choose IFC file"):
-                                ret = QtGui.QFileDialog.getOpenFileName(None, translate("BIMBots","Choose an existing IFC file"), None, translate("BIMBots","IFC files (*.ifc)"))
-                                if ret:
-                                    file_path = ret[0]
-                                    if file_path:
-                                        self.form.progressBar.setFormat(translate("BIMBots","Sending data"))
-                                        self.form.progressBar.setValue(75)
-                                        results = send_ifc_payload(provider_url,service_id,file_path)
-                            else:
-                                if FreeCAD.ActiveDocument:
-                                    objectslist = []
-                                    self.form.progressBar.setFormat(translate("BIMBots","Saving IFC file"))
-                                    self.form.progressBar.setValue(25)
-                                    if scopeitem.text() == translate("BIMBots","Selected objects"):
-                                        objectslist = FreeCADGui.Selection.getSelection()
-                                    elif scopeitem.text() == translate("BIMBots","All visible objects"):
-                                        objectslist = [o for o in FreeCAD.ActiveDocument.Objects if o.ViewObject and hasattr(o.ViewObject,"Visibility") and o.ViewObject.Visibility]
-                                    else:
-                                        objectslist = FreeCAD.ActiveDocument.Objects
-                                    if objectslist:
-                                        file_path = self.save_ifc(objectslist)
-                                        if file_path:
-                                            self.form.progressBar.setFormat(translate("BIMBots","Sending data"))
-                                            self.form.progressBar.setValue(75)
-                                            results = send_ifc_payload(provider_url,service_id,file_path)
+    """Keeps provider_record and service_record objects for all known providers and services, keyed by
+    list url and by (list url, service id). Rescanning updates existing records in place, so references
+    to them stay valid, and removes the ones that disappeared."""
 
-        # show the results
-        self.form.groupProgress.hide()
-        if results:
-            self.form.groupServices.hide()
-            self.form.groupRun.hide()
-            self.form.groupResults.show()
-            if isinstance(results,dict):
-                # json results
-                self.form.textResults.hide()
-                self.form.treeResults.show()
-                self.form.treeResults.clear()
-                self.fill_item(self.form.treeResults.invisibleRootItem(), results)
+    def __init__(self):
+
+        self.providers = {} # list url: provider_record
+        self.services = {} # (list url, service id): service_record
+        self.provider_order = [] # list urls, in the order they were found
+        self.provider_services = {} # list url: list of service keys, in the order they were found
+
+    def scan_providers(self,autodiscover=True,providers=None):
+
+        """Fetches the list of providers, or uses the given list of provider dicts (see get_service_providers()),
+        and updates the records. Returns the list of provider records"""
+
+        if providers is None:
+            providers = get_service_providers(autodiscover=autodiscover)
+        found = []
+        for data in providers:
+            url = data['listUrl']
+            if url in self.providers:
+                self.providers[url].update(data)
             else:
-                # text results
-                if service_data:
-                    # detect if this is a BCF file - we just analyze the first output type for now
-                    if ("outputs" in service_data) and service_data["outputs"] and ("BCF" in service_data["outputs"][0]):
-                        # BCF results
-                        zipfile = tempfile.mkstemp(suffix=".bcf.zip")[1]
-                        f = open(zipfile,"wb")
-                        f.write(results)
-                        f.close()
-                        results = translate("BIMBots","BCF results saved as:")+" " + zipfile + ". "+translate("BIMBots","BCF viewing is not yet implemented.")
-                if DEBUG:
-                    print(translate("BIMBots","Results")+":",results)
-                self.form.textResults.show()
-                self.form.treeResults.hide()
-                self.form.textResults.clear()
-                self.form.textResults.setPlainText(results)
-        else:
-            FreeCAD.Console.PrintError(translate("BIMBots","Error: No results obtained")+"\n")
-            QtGui.QMessageBox.critical(None,translate("BIMBots","Empty response"),
-                                       translate("BIMBots","The server didn't send a valid response. There can be many reasons to this, but the most likely is that the IFC file generated from your model wasn't accepted by the server. Try working with only a couple of selected objects first, to see if the service is responding correctly."))
+                self.providers[url] = provider_record(data)
+            if url not in found:
+                found.append(url)
+        for url in self.provider_order:
+            if url not in found:
+                self.remove_provider(url)
+        self.provider_order = found
+        return [self.providers[url] for url in found]
+
+    def scan_services(self,list_url,services=None):
+
+        """Fetches the services of the given provider, or uses the given list of service dicts (see get_services()),
+        and updates the records. Returns the list of service records"""
+
+        provider = self.providers.get(list_url)
+        if services is None:
+            services = get_services(list_url)
+        found = []
+        for data in services:
+            key = (list_url,data['id'])
+            if key in self.services:
+                self.services[key].update(data)
+            else:
+                self.services[key] = service_record(list_url,data)
+            if key not in found:
+                found.append(key)
+        for key in self.provider_services.get(list_url,[]):
+            if key not in found:
+                del self.services[key]
+        self.provider_services[list_url] = found
+        if provider:
+            provider.reachable = bool(services)
+        self.refresh_authentication()
+        return [self.services[key] for key in found]
 
-    def fill_item(self, item, value, link=False):
+    def scan(self,autodiscover=True):
 
-        "fills a QtreeWidget or QtreeWidgetItem with a dict, list or text/number value. If link is true, paints in link color. Returns nothing"
+        "Fetches all providers and their services. Returns nothing"
 
-        # adapted from https://stackoverflow.com/questions/21805047/qtreewidget-to-mirror-python-dictionary
-        item.setExpanded(True)
-        if isinstance(value,dict):
-            for key, val in sorted(value.items()):
-                child = QtGui.QTreeWidgetItem()
-                item.addChild(child)
-                child.setExpanded(True)
-                if tostr(key).lower().startswith("ifc"):
-                    palette = QtGui.QApplication.palette()
-                    child.setForeground(0,palette.brush(palette.Active,palette.Link))
-                    child.setToolTip(0,"typeLink:"+tostr(key))
-                if DECAMELIZE:
-                    key = ''.join(map(lambda x: x if x.islower() else " "+x, key)).strip()
-                child.setText(0, tostr(key))
-                childlink = link
-                if (tostr(key).lower() == "guid"):
-                    childlink = "uuidLink:"
-                elif ((tostr(key).lower() == "name") and (tostr(val) != tostr(val).upper())):
-                    childlink = "nameLink:"
-                elif ((tostr(key).lower() == "type") and (tostr(val).lower().startswith("ifc"))):
-                    childlink = "typeLink:"
-                self.fill_item(child, val, childlink)
-        elif isinstance(value,list):
-            for index,val in enumerate(value):
-                child = QtGui.QTreeWidgetItem()
+        for provider in self.scan_providers(autodiscover):
+            self.scan_services(provider.list_url)
+        self.save_cache()
+
+    def remove_provider(self,list_url):
+
+        "Removes the given provider and its services from the registry. Returns nothing"
+
+        for key in self.provider_services.pop(list_url,[]):
+            self.services.pop(key,None)
+        self.providers.pop(list_url,None)
+        if list_url in self.provider_order:
+            self.provider_order.remove(list_url)
+
+    def refresh_authentication(self):
+
+        "Updates the authentication state of all services from the config file, read once. Returns nothing"
+
+        authenticated = set()
+        for service in read_config().get('services',[]):
+            if 'token' in service:
+                authenticated.add((service['provider_url'],service['id']))
+        for key, service in self.services.items():
+            service.authenticated = key in authenticated
+
+    def get_provider(self,list_url):
+
+        "Returns the provider_record with the given list url, or None"
+
+        return self.providers.get(list_url)
+
+    def get_service(self,key):
+
+        "Returns the service_record with the given (list url, service id) key, or None"
+
+        if key is None:
+            return None
+        return self.services.get(tuple(key))
+
+    def get_services(self,list_url):
+
+        "Returns the service records of the given provider, in the order they were found"
+
+        return [self.services[key] for key in self.provider_services.get(list_url,[])]
+
+    def get_mirrors(self,key):
+
+        "Returns the service records having the same identity as the given service, itself included, in provider order"
+
+        service = self.get_service(key)
+        if not service:
+            return []
+        return [s for url in self.provider_order for s in self.get_services(url) if s.identity == service.identity]
+
+    def rank_mirrors(self,key,size=0):
+
+        """Returns the mirrors of the given service (see get_mirrors()) from best to worst: authenticated first,
+        then healthy (provider reachable, last run successful, no more than half of the last runs failed),
+        then by the expected duration of a run sending size bytes, from the measured round trip time and
+        upload throughput of each mirror (see get_endpoint_stats()). Mirrors never used are assumed as slow
+        as the slowest measured one"""
+
+        candidates = []
+        for mirror in self.get_mirrors(key):
+            config = get_service_config(mirror.provider_url,mirror.id)
+            stats = get_endpoint_stats(config['service_url']) if config else None
+            provider = self.get_provider(mirror.provider_url)
+            healthy = not (provider and (provider.reachable == False))
+            if stats and ((not stats['last_ok']) or (stats['failures'] * 2 > stats['samples'])):
+                healthy = False
+            latency = stats['latency'] if stats else None
+            if latency is None:
+                # only the services list of this provider has been timed, if anything
+                list_stats = get_endpoint_stats(mirror.provider_url)
+                latency = list_stats['latency'] if list_stats else None
+            candidates.append((mirror,config is not None,healthy,latency,stats['throughput'] if stats else None))
+        latencies = [c[3] for c in candidates if c[3] is not None]
+        throughputs = [c[4] for c in candidates if c[4]]
+        ranked = []
+        for position, (mirror, authenticated, healthy, latency, throughput) in enumerate(candidates):
+            expected = max(latencies) if latency is None and latencies else (latency or 0.0)
+            throughput = throughput or (min(throughputs) if throughputs else None)
+            if throughput:
+                expected += size / throughput
+            ranked.append(((not authenticated,not healthy,expected,position),mirror))
+        ranked.sort(key=lambda r: r[0])
+        return [r[1] for r in ranked]
+
+    def save_cache(self,path=None):
+
+        "Saves the known providers and services to the cache file, so they can be shown at once on next startup. Returns nothing"
+
+        cache = []
+        for list_url in self.provider_order:
+            provider = self.providers[list_url]
+            cache.append({"provider":provider.data,
+                          "reachable":provider.reachable,
+                          "services":[service.data for service in self.get_services(list_url)]})
+        try:
+            with open(path or CACHE_FILE,"w") as cache_file:
+                json.dump(cache,cache_file)
+        except (IOError,OSError):
+            if DEBUG:
+                print("Error: unable to write cache file",path or CACHE_FILE)
+
+    def load_cache(self,path=None):
+
+        "Fills the registry from the cache file, without any network access. Returns True if something was loaded"
+
+        path = path or CACHE_FILE
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path) as cache_file:
+                cache = json.load(cache_file)
+        except (IOError,OSError,ValueError):
+            if DEBUG:
+                print("Error: unable to read cache file",path)
+            return False
+        for entry in cache:
+            provider = provider_record(entry['provider'])
+            provider.reachable = entry.get('reachable')
+            self.providers[provider.list_url] = provider
+            self.provider_order.append(provider.list_url)
+            keys = []
+            for data in entry.get('services',[]):
+                service = service_record(provider.list_url,data)
+                self.services[service.key] = service
+                keys.append(service.key)
+            self.provider_services[provider.list_url] = keys
+        self.refresh_authentication()
+        return bool(cache)
+
+
+# the registry shared by the module functions and the FreeCAD panel
+registry = service_registry()
+
+
+def send_mirrored_payload(provider_url,service_id,file_path,context_id=None,info=None):
+
+    """Sends the given IFC file to the best mirror of the given service, that is, the same service offered
+    by another provider (see service_registry.rank_mirrors()), and to the next mirrors in turn if it fails.
+    Only authenticated mirrors known to the registry are used, or the given service alone if the registry
+    doesn't know it. Models are split for split-safe mirrors (see send_split_payload()). The context_id is
+    only sent to the given service. Returns the results of the first mirror that gives some, or an empty
+    dict. If an info dict is given, it receives the same values as with send_ifc_payload(), plus the
+    provider_url and service_id of the mirror that gave the results, and the last error, if any (error)"""
+
+    size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+    mirrors = [m.key for m in registry.rank_mirrors((provider_url,service_id),size) if get_service_config(m.provider_url,m.id)]
+    if not mirrors:
+        mirrors = [(provider_url,service_id)]
+    for mirror_url, mirror_id in mirrors:
+        mirror_info = {}
+        same = (mirror_url,mirror_id) == (provider_url,service_id)
+        try:
+            if is_split_safe(mirror_url,mirror_id):
+                results = send_split_payload(mirror_url,mirror_id,file_path,info=mirror_info)
+            else:
+                results = send_ifc_payload(mirror_url,mirror_id,file_path,context_id if same else None,mirror_info)
+        except Exception as e:
+            results = None
+            if info is not None:
+                info['error'] = tostr(e)
+        if results:
+            if not same:
+                # a Context-Id is only valid for the provider that gave it
+                mirror_info.pop('context_id',None)
+            if info is not None:
+                info.update(mirror_info)
+                info['provider_url'] = mirror_url
+                info['service_id'] = mirror_id
+            return results
+        if DEBUG:
+            print("Error: no results from service",mirror_id,"at",mirror_url)
+    return {}
+
+
+
+#############   Results history - stores past runs in a local SQLite database
+
+
+def get_model_fingerprint(data):
+
+    """Returns a fingerprint (a sha1 hex string) identifying the model contained in the given IFC
+    data (file contents as a string). The header and owner history entities, which contain timestamps
+    that change at each export, are ignored, and so are the GlobalIds of relationships, property sets
+    and quantity sets, which exporters create anew at each export. Products keep their GlobalId, so two
+    exports of the same model give the same fingerprint."""
+
+    import re
+    if isinstance(data,bytes) and not isinstance(data,str):
+        data = data.decode("utf8","ignore")
+    # the first attribute of IfcRoot entities is their GlobalId
+    regenerated = re.compile("^(\\s*#\\d+\\s*=\\s*IFC(?:REL\\w+|PROPERTYSET|ELEMENTQUANTITY)\\s*\\(\\s*)'[^']*'",re.I)
+    sha = hashlib.sha1()
+    indata = False
+    for line in data.splitlines():
+        if not indata:
+            indata = line.strip().upper() == "DATA;"
+        elif "IFCOWNERHISTORY" not in line.upper():
+            line = regenerated.sub("\\1''",line)
+            if not isinstance(line,bytes):
+                line = line.encode("utf8")
+            sha.update(line+b"\n")
+    return sha.hexdigest()
+
+
+def get_file_fingerprint(file_path):
+
+    "Returns the model fingerprint (see get_model_fingerprint()) of the given IFC file, or None if it cannot be read"
+
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path) as file_stream:
+        return get_model_fingerprint(file_stream.read())
+
+
+def open_history(path=None):
+
+    "Opens (and creates if needed) the history database at the given path or at HISTORY_FILE. Returns a sqlite3 connection"
+
+    # Structure of the history database:
+    #
+    # runs: one row per result obtained from a service
+    #   id, model (fingerprint), provider_url, service_id (stored as text), service_name,
+    #   timestamp (seconds since epoch), duration (seconds spent waiting for the service),
+    #   payload_size (bytes), result_type ("json", "bcf" or "text"), result (raw blob)
+    # elements: one row per element (anything with a GUID) found in a result
+    #   run_id, guid, ifc_type, name, path (location in the result, without list indices),
+    #   signature (the element data, used to compare runs)
+
+    db = sqlite3.connect(path or HISTORY_FILE)
+    db.execute("CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY AUTOINCREMENT, model TEXT, provider_url TEXT, service_id TEXT, service_name TEXT, timestamp REAL, duration REAL, payload_size INTEGER, result_type TEXT, result BLOB)")
+    db.execute("CREATE TABLE IF NOT EXISTS elements (run_id INTEGER, guid TEXT, ifc_type TEXT, name TEXT, path TEXT, signature TEXT)")
+    db.execute("CREATE INDEX IF NOT EXISTS runs_service ON runs (provider_url, service_id, timestamp)")
+    db.execute("CREATE INDEX IF NOT EXISTS runs_model ON runs (model, timestamp)")
+    db.execute("CREATE INDEX IF NOT EXISTS elements_guid ON elements (guid)")
+    db.execute("CREATE INDEX IF NOT EXISTS elements_run ON elements (run_id)")
+    return db
+
+
+def get_result_guid(results):
+
+    "Returns the GUID of the given json result item, or None if it is not a dict having a guid"
+
+    if isinstance(results,dict):
+        for key in ("guid","globalId","GlobalId","ifcGuid","IfcGuid"):
+            if key in results:
+                return results[key]
+    return None
+
+
+def extract_result_rows(results,path=""):
+
+    """Returns a list of (guid,ifc_type,name,path,signature) tuples, one for each element (dict
+    having a guid) found in the given json results (dict or list)"""
+
+    rows = []
+    if isinstance(results,dict):
+        guid = get_result_guid(results)
+        if guid:
+            ifc_type = results.get("type") or results.get("ifcType") or ""
+            if not tostr(ifc_type).lower().startswith("ifc"):
+                # perType-style dicts are keyed by their ifc type
+                last = path.split("/")[-1]
+                ifc_type = last if last.lower().startswith("ifc") else ""
+            # the signature only contains the simple values of this element, not its children
+            values = dict([(k,v) for k,v in results.items() if not isinstance(v,(dict,list))])
+            rows.append((tostr(guid),tostr(ifc_type),tostr(results.get("name","")),path,json.dumps(values,sort_keys=True)))
+        for key, val in results.items():
+            if isinstance(val,(dict,list)):
+                rows.extend(extract_result_rows(val,path+"/"+tostr(key)))
+    elif isinstance(results,list):
+        for val in results:
+            rows.extend(extract_result_rows(val,path))
+    return rows
+
+
+def extract_bcf_rows(data):
+
+    """Returns a list of (guid,ifc_type,name,path,signature) tuples, one for each component referenced
+    by the topics of the given BCF zip file contents. The topic title is used as name, and as signature
+    in the form of a json dict {title}."""
+
+    import io
+    import xml.etree.ElementTree as ElementTree
+    rows = []
+    try:
+        bcf = zipfile.ZipFile(io.BytesIO(data))
+        for entry in bcf.namelist():
+            if entry.endswith("markup.bcf"):
+                root = ElementTree.fromstring(bcf.read(entry))
+                title = root.findtext("Topic/Title") or ""
+                topic = entry.split("/")[0]
+                for viewpoint in bcf.namelist():
+                    if viewpoint.startswith(topic+"/") and viewpoint.endswith(".bcfv"):
+                        vroot = ElementTree.fromstring(bcf.read(viewpoint))
+                        for component in vroot.iter("Component"):
+                            guid = component.get("IfcGuid")
+                            if guid:
+                                rows.append((guid,"",title,"/"+topic,json.dumps({"title":title})))
+    except:
+        if DEBUG:
+            print("Error: unable to read BCF data")
+    return rows
+
+
+def get_result_type(results):
+
+    "Returns the type of the given service results: json, bcf or text"
+
+    if isinstance(results,(dict,list)):
+        return "json"
+    if isinstance(results,bytes) and results.startswith(b"PK"):
+        return "bcf"
+    return "text"
+
+
+def save_run(provider_url,service_id,model,results,duration=None,payload_size=None,service_name=None,timestamp=None,path=None):
+
+    "Stores the given results in the history database. Returns the id of the new run"
+
+    result_type = get_result_type(results)
+    if result_type == "json":
+        blob = json.dumps(results).encode("utf8")
+        rows = extract_result_rows(results)
+    else:
+        blob = results if isinstance(results,bytes) else tostr(results).encode("utf8")
+        rows = extract_bcf_rows(blob) if result_type == "bcf" else []
+    if not service_name:
+        service = get_service_config(provider_url,service_id)
+        if service:
+            service_name = service['name']
+    db = open_history(path)
+    try:
+        with db:
+            cursor = db.execute("INSERT INTO runs (model, provider_url, service_id, service_name, timestamp, duration, payload_size, result_type, result) VALUES (?,?,?,?,?,?,?,?,?)",
+                                (model,provider_url,tostr(service_id),service_name,timestamp or time.time(),duration,payload_size,result_type,sqlite3.Binary(blob)))
+            run_id = cursor.lastrowid
+            db.executemany("INSERT INTO elements (run_id, guid, ifc_type, name, path, signature) VALUES (?,?,?,?,?,?)",
+                           [(run_id,)+row for row in rows])
+    finally:
+        db.close()
+    if DEBUG:
+        print("Saved run",run_id,"with",len(rows),"elements to history")
+    return run_id
+
+
+def record_run(provider_url,service_id,data,results,duration=None):
+
+    "Stores the results obtained by sending the given IFC data to the history database, if enabled. Never fails. Returns the run id or None"
+
+    if not get_config_value("keep_history"):
+        return None
+    try:
+        return save_run(provider_url,service_id,get_model_fingerprint(data),results,duration,len(data))
+    except:
+        if DEBUG:
+            print("Error: unable to save results to history at",HISTORY_FILE)
+        return None
+
+
+def get_runs(provider_url=None,service_id=None,model=None,limit=None,path=None):
+
+    """Returns a list of dicts {id,model,provider_url,service_id,service_name,timestamp,duration,payload_size,result_type}
+    describing past runs, newest first, optionally restricted to the given service and/or model"""
+
+    query = "SELECT id, model, provider_url, service_id, service_name, timestamp, duration, payload_size, result_type FROM runs"
+    conditions = []
+    args = []
+    if provider_url:
+        conditions.append("provider_url = ?")
+        args.append(provider_url)
+    if service_id is not None:
+        conditions.append("service_id = ?")
+        args.append(tostr(service_id))
+    if model:
+        conditions.append("model = ?")
+        args.append(model)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY timestamp DESC, id DESC"
+    if limit:
+        query += " LIMIT " + str(int(limit))
+    keys = ["id","model","provider_url","service_id","service_name","timestamp","duration","payload_size","result_type"]
+    db = open_history(path)
+    try:
+        return [dict(zip(keys,row)) for row in db.execute(query,args)]
+    finally:
+        db.close()
+
+
+def get_run_results(run_id,path=None):
+
+    "Returns the results stored for the given run: a dict for json results, bytes for BCF, a string for text, or None if not found"
+
+    db = open_history(path)
+    try:
+        row = db.execute("SELECT result_type, result FROM runs WHERE id = ?",(run_id,)).fetchone()
+    finally:
+        db.close()
+    if not row:
+        return None
+    result_type, blob = row
+    blob = bytes(blob)
+    if result_type == "json":
+        return json.loads(blob.decode("utf8"))
+    elif result_type == "text":
+        return blob.decode("utf8")
+    return blob
+
+
+def get_guid_history(guid,path=None):
+
+    "Returns a list of dicts {run_id,model,provider_url,service_id,service_name,timestamp,ifc_type,name,path,signature} for the given IFC GUID, newest first"
+
+    keys = ["run_id","model","provider_url","service_id","service_name","timestamp","ifc_type","name","path","signature"]
+    db = open_history(path)
+    try:
+        rows = db.execute("SELECT runs.id, runs.model, runs.provider_url, runs.service_id, runs.service_name, runs.timestamp, "
+                          "elements.ifc_type, elements.name, elements.path, elements.signature "
+                          "FROM elements JOIN runs ON runs.id = elements.run_id WHERE elements.guid = ? "
+                          "ORDER BY runs.timestamp DESC",(guid,))
+        return [dict(zip(keys,row)) for row in rows]
+    finally:
+        db.close()
+
+
+def diff_runs(old_run_id,new_run_id,path=None):
+
+    """Compares the findings of two runs (usually of the same service on the same model). An element can
+    have several findings at the same location in the results: findings with the same GUID, location and
+    signature are matched first, then the remaining findings of an element at the same location are paired
+    as changed. Returns a dict {new,resolved,changed,unchanged} of lists of dicts {guid,ifc_type,name,path,signature}.
+    Changed findings also have the signature of the old run (old_signature)"""
+
+    keys = ["guid","ifc_type","name","path","signature"]
+    query = "SELECT guid, ifc_type, name, path, signature FROM elements WHERE run_id = ? ORDER BY guid, path, signature"
+    old = {}
+    new = {}
+    db = open_history(path)
+    try:
+        for rows, run_id in ((old,old_run_id),(new,new_run_id)):
+            for row in db.execute(query,(run_id,)):
+                rows.setdefault((row[0],row[3]),[]).append(row)
+    finally:
+        db.close()
+    diff = {"new":[],"resolved":[],"changed":[],"unchanged":[]}
+    for key in sorted(set(old) | set(new)):
+        old_rows = list(old.get(key,[]))
+        new_rows = []
+        for row in new.get(key,[]):
+            same = [r for r in old_rows if r[4] == row[4]]
+            if same:
+                old_rows.remove(same[0])
+                diff['unchanged'].append(dict(zip(keys,row)))
+            else:
+                new_rows.append(row)
+        for old_row, new_row in zip(old_rows,new_rows):
+            element = dict(zip(keys,new_row))
+            element['old_signature'] = old_row[4]
+            diff['changed'].append(element)
+        diff['new'].extend([dict(zip(keys,row)) for row in new_rows[len(old_rows):]])
+        diff['resolved'].extend([dict(zip(keys,row)) for row in old_rows[len(new_rows):]])
+    return diff
+
+
+def diff_last_runs(provider_url,service_id,model,path=None):
+
+    "Compares the two last runs of the given service on the given model. Returns a dict like diff_runs(), or None if there are less than two runs"
+
+    runs = get_runs(provider_url,service_id,model,limit=2,path=path)
+    if len(runs) < 2:
+        return None
+    return diff_runs(runs[1]['id'],runs[0]['id'],path)
+
+
+
+class guid_index:
+
+    """An index of the elements found by all the services that were run on a given model, keyed
+    by IFC GUID. Only the latest run of each service on that model is taken into account.
+    index[guid] returns the list of findings for that element, each finding being a dict
+    {run_id,provider_url,service_id,service_name,timestamp,ifc_type,name,path,data}"""
+
+    def __init__(self,model,path=None):
+
+        self.model = model
+        self.findings = {} # guid: list of findings
+        self.runs = [] # the runs taken into account, as returned by get_runs()
+        keys = ["run_id","provider_url","service_id","service_name","timestamp","guid","ifc_type","name","path","signature"]
+        db = open_history(path)
+        try:
+            rows = db.execute("SELECT runs.id, runs.provider_url, runs.service_id, runs.service_name, runs.timestamp, "
+                              "elements.guid, elements.ifc_type, elements.name, elements.path, elements.signature "
+                              "FROM runs JOIN elements ON elements.run_id = runs.id "
+                              "WHERE runs.model = ? AND runs.timestamp = (SELECT MAX(last.timestamp) FROM runs AS last "
+                              "WHERE last.model = runs.model AND last.provider_url = runs.provider_url AND last.service_id = runs.service_id)",
+                              (model,)).fetchall()
+        finally:
+            db.close()
+        runs = {}
+        for row in rows:
+            finding = dict(zip(keys,row))
+            guid = finding.pop("guid")
+            try:
+                finding['data'] = json.loads(finding.pop("signature"))
+            except ValueError:
+                finding['data'] = None
+            if not isinstance(finding['data'],dict):
+                # BCF topics stored by older versions have their raw title as signature
+                finding['data'] = {"title":finding['name']}
+            self.findings.setdefault(guid,[]).append(finding)
+            runs[finding['run_id']] = True
+        self.runs = [r for r in get_runs(model=model,path=path) if r['id'] in runs]
+
+    def __contains__(self,guid):
+
+        return guid in self.findings
+
+    def __getitem__(self,guid):
+
+        return self.findings.get(guid,[])
+
+    def __len__(self):
+
+        return len(self.findings)
+
+    def get_report(self,guids):
+
+        "Returns a json-like dict {guid: {service name: [finding data, ...]}} for the given GUIDs that have findings"
+
+        report = {}
+        for guid in guids:
+            for finding in self[guid]:
+                service = finding['service_name'] or tostr(finding['service_id'])
+                data = dict(finding['data'])
+                data['location'] = finding['path']
+                report.setdefault(guid,{}).setdefault(service,[]).append(data)
+        return report
+
+
+def get_latest_model(guid,path=None):
+
+    "Returns the fingerprint of the model of the latest run that found the given IFC GUID, or None"
+
+    history = get_guid_history(guid,path)
+    if history:
+        return history[0]['model']
+    return None
+
+
+
+def is_guid_report(results):
+
+    "Returns True if the given results have the shape of a guid_index.get_report() report: {guid: {service name: [finding dict, ...]}}"
+
+    if not (isinstance(results,dict) and results):
+        return False
+    for services in results.values():
+        if not (isinstance(services,dict) and services):
+            return False
+        for findings in services.values():
+            if not (isinstance(findings,list) and findings and all([isinstance(f,dict) for f in findings])):
+                return False
+    return True
+
+
+def get_guid_scores(results):
+
+    """Returns a dict {guid: score} for the elements found in the given results (json dict, BCF data,
+    or a report from guid_index.get_report()). The score of an element is the sum of the severity of
+    its findings, a finding without a numeric severity counting as 1"""
+
+    if is_guid_report(results):
+        rows = [(guid,"","","",json.dumps(f)) for guid, services in results.items()
+                for findings in services.values() for f in findings]
+    elif isinstance(results,dict) or isinstance(results,list):
+        rows = extract_result_rows(results)
+    elif get_result_type(results) == "bcf":
+        rows = extract_bcf_rows(results)
+    else:
+        rows = []
+    scores = {}
+    for row in rows:
+        score = 1
+        try:
+            data = json.loads(row[4])
+        except ValueError:
+            data = None
+        severity = data.get("severity") if isinstance(data,dict) else None
+        if is_number(severity):
+            score = severity
+        scores[row[0]] = scores.get(row[0],0) + score
+    return scores
+
+
+def get_score_color(score,maximum):
+
+    "Returns a (r,g,b) color for the given score: green for 0, then from yellow to red up to the given maximum score"
+
+    if score <= 0:
+        return (0.2,0.8,0.2)
+    ratio = min(1.0,float(score)/maximum) if maximum > 0 else 1.0
+    return (1.0,0.9*(1.0-ratio),0.0)
+
+
+
+#############   Service statistics - timeouts and concurrency adapted to observed latency
+
+
+# the number of requests currently sent to each endpoint by this session
+in_flight = {}
+
+
+def begin_request(endpoint):
+
+    "Counts a new request to the given endpoint (url) as in flight. Returns the number of requests now in flight to it"
+
+    # not locked: an approximate count is good enough here
+    in_flight[endpoint] = in_flight.get(endpoint,0) + 1
+    return in_flight[endpoint]
+
+
+def end_request(endpoint):
+
+    "Counts a request to the given endpoint as finished. Returns nothing"
+
+    in_flight[endpoint] = max(0,in_flight.get(endpoint,1) - 1)
+
+
+def open_timings(path=None):
+
+    "Opens the history database and creates the timings table if needed. Returns a sqlite3 connection"
+
+    # timings: one row per request sent to a service or a services list
+    #   endpoint (the requested url), timestamp, size (bytes sent), duration (seconds),
+    #   ok (0 if the request failed or timed out), concurrency (requests in flight to the same endpoint)
+
+    db = open_history(path)
+    db.execute("CREATE TABLE IF NOT EXISTS timings (endpoint TEXT, timestamp REAL, size INTEGER, duration REAL, ok INTEGER, concurrency INTEGER)")
+    db.execute("CREATE INDEX IF NOT EXISTS timings_endpoint ON timings (endpoint, timestamp)")
+    return db
+
+
+def record_timing(endpoint,duration,size=0,ok=True,concurrency=1,path=None):
+
+    """Stores the duration of a request to the given endpoint, keeping only the last TIMINGS_WINDOW
+    durations of each endpoint. Never fails. Returns nothing"""
+
+    try:
+        db = open_timings(path)
+        try:
+            with db:
+                db.execute("INSERT INTO timings (endpoint, timestamp, size, duration, ok, concurrency) VALUES (?,?,?,?,?,?)",
+                           (endpoint,time.time(),size,duration,int(bool(ok)),concurrency))
+                db.execute("DELETE FROM timings WHERE endpoint = ? AND rowid NOT IN (SELECT rowid FROM timings WHERE endpoint = ? ORDER BY timestamp DESC LIMIT ?)",
+                           (endpoint,endpoint,TIMINGS_WINDOW))
+        finally:
+            db.close()
+    except:
+        if DEBUG:
+            print("Error: unable to save timing to history at",HISTORY_FILE)
+
+
+def get_timings(endpoint,limit=None,path=None):
+
+    "Returns a list of (size,duration,ok,concurrency) tuples of the last requests to the given endpoint, newest first"
+
+    try:
+        db = open_timings(path)
+    except:
+        return []
+    try:
+        return db.execute("SELECT size, duration, ok, concurrency FROM timings WHERE endpoint = ? ORDER BY timestamp DESC LIMIT ?",(endpoint,limit or TIMINGS_WINDOW)).fetchall()
+    finally:
+        db.close()
+
+
+def get_endpoint_stats(endpoint,path=None):
+
+    """Returns a dict describing the last requests to the given endpoint: samples, failures, last_ok (False
+    if the last request failed), latency (the
+    time of an empty request, in seconds), throughput (bytes per second, None if unknown) and error (the
+    largest duration observed above the latency + size / throughput estimate). Returns None if there is no history"""
+
+    timings = get_timings(endpoint,path=path)
+    if not timings:
+        return None
+    done = [(size or 0,duration) for size, duration, ok, concurrency in timings if ok]
+    stats = {"samples":len(timings),"failures":len(timings)-len(done),"last_ok":bool(timings[0][2]),"latency":None,"throughput":None,"error":0.0}
+    if not done:
+        return stats
+    # least squares fit of duration = latency + size / throughput
+    count = float(len(done))
+    mean_size = sum([s for s, d in done]) / count
+    mean_duration = sum([d for s, d in done]) / count
+    variance = sum([(s-mean_size)**2 for s, d in done])
+    slope = 0.0
+    if variance > 0:
+        slope = max(0.0,sum([(s-mean_size)*(d-mean_duration) for s, d in done]) / variance)
+    latency = max(0.0,mean_duration - slope * mean_size)
+    stats['latency'] = latency
+    stats['throughput'] = 1.0 / slope if slope > 0 else None
+    stats['error'] = max([0.0]+[d - (latency + slope * s) for s, d in done])
+    return stats
+
+
+def get_timeout(endpoint,size=0,path=None):
+
+    """Returns a (connect, read) timeouts tuple, in seconds, for a request sending size bytes to the given
+    endpoint. The connect timeout follows the observed latency, so dead hosts are given up quickly, and the
+    read timeout the time expected for that size, so long analyses are waited for. Both stay between the
+    min_timeout and max_timeout config values. Without history, connection_timeout is used to connect, and
+    to read as well if nothing is sent, max_timeout otherwise"""
+
+    low = get_config_value("min_timeout")
+    high = get_config_value("max_timeout")
+    default = get_config_value("connection_timeout")
+    stats = get_endpoint_stats(endpoint,path)
+    if (not stats) or (stats['latency'] is None):
+        return (default,default if not size else high)
+    factor = get_config_value("timeout_factor")
+    connect = min(max(low,factor * stats['latency']),default)
+    expected = stats['latency'] + stats['error']
+    if stats['throughput']:
+        expected += size / stats['throughput']
+    elif size:
+        # no relation between size and duration seen yet
+        return (connect,high)
+    return (connect,min(max(low,factor * expected),high))
+
+
+def get_concurrency(endpoint,path=None):
+
+    """Returns the number of requests that can be sent at the same time to the given endpoint. It is the
+    max_concurrency config value until 5 requests have been timed, then falls below the lowest concurrency
+    where more than a fifth of the requests failed, or grows by one above the highest concurrency that
+    worked. It never goes above max_concurrency"""
+
+    high = get_config_value("max_concurrency")
+    levels = {}
+    timings = get_timings(endpoint,path=path)
+    for size, duration, ok, concurrency in timings:
+        level = levels.setdefault(concurrency or 1,[0,0])
+        level[0] += 1
+        level[1] += 0 if ok else 1
+    failing = [c for c, l in levels.items() if l[1] > 0.2 * l[0]]
+    if failing:
+        return max(1,min(min(failing)-1,high))
+    if len(timings) < 5:
+        return high
+    working = [c for c, l in levels.items() if l[1] < l[0]]
+    return max(1,min(max(working+[0])+1,high))
+
+
+def send_request(method,url,size=0,**kwargs):
+
+    """Sends a request with requests.request(), with timeouts adapted to the given url and size (see
+    get_timeout()), and stores its duration in the history. Returns the response. Raises requests errors"""
+
+    if "timeout" not in kwargs:
+        kwargs['timeout'] = get_timeout(url,size)
+    concurrency = begin_request(url)
+    start = time.time()
+    ok = False
+    try:
+        response = requests.request(method,url,**kwargs)
+        ok = response.status_code < 500
+        return response
+    finally:
+        end_request(url)
+        record_timing(url,time.time()-start,size,ok,concurrency)
+
+
+
+#############   Shared cache - results shared by a team, before contacting the providers
+
+
+def get_shared_cache_keys(provider_url,service_id,data):
+
+    """Returns the (service key, payload key) tuple under which the results of the given service on the given
+    IFC data are stored in the shared cache. The service key is a hash of the provider url and service id, so
+    results are only shared between runs of the same service of the same provider, never between mirrors.
+    The payload key is the model fingerprint (see get_model_fingerprint()), so two exports of the same model share their results"""
+
+    service = hashlib.sha1((tostr(provider_url)+"|"+tostr(service_id)).encode("utf8")).hexdigest()
+    return (service,get_model_fingerprint(data))
+
+
+class shared_cache_store:
+
+    """A directory holding shared results, one file per service and payload keys (see get_shared_cache_keys()).
+    It is used directly as a local shared cache (for example on a network drive, or in tests), and by the
+    shared cache server. If tokens are given, as a dict {token: list of services or "*"}, where services
+    are service keys or {provider_url,id} dicts, only requests bearing a token allowed for their service succeed"""
+
+    def __init__(self,path,tokens=None):
+
+        self.path = path
+        self.tokens = None
+        if tokens is not None:
+            self.tokens = {}
+            for token, services in tokens.items():
+                if services != "*":
+                    services = set([get_shared_cache_keys(s['provider_url'],s['id'],"")[0] if isinstance(s,dict) else s for s in services])
+                self.tokens[token] = services
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+    def allowed(self,service,token=None):
+
+        "Returns True if the given token can read and write the results of the given service key"
+
+        if self.tokens is None:
+            return True
+        services = self.tokens.get(token)
+        return (services == "*") or bool(services and (service in services))
+
+    def get_path(self,service,payload):
+
+        "Returns the file path of the given keys, or None if they are not valid keys"
+
+        import re
+        if not (re.match("^[0-9a-f]{40}$",service) and re.match("^[0-9a-f]{40}$",payload)):
+            return None
+        return os.path.join(self.path,service,payload)
+
+    def get(self,service,payload,token=None):
+
+        "Returns the stored results (bytes) for the given keys, or None"
+
+        path = self.get_path(service,payload)
+        if (not path) or (not self.allowed(service,token)) or (not os.path.exists(path)):
+            return None
+        with open(path,"rb") as result_file:
+            return result_file.read()
+
+    def put(self,service,payload,data,token=None):
+
+        "Stores the given results (bytes) under the given keys. Returns True if successful"
+
+        path = self.get_path(service,payload)
+        if (not path) or (not self.allowed(service,token)):
+            return False
+        if not os.path.isdir(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError:
+                # created by another request meanwhile
+                pass
+        fd, temp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd,"wb") as result_file:
+            result_file.write(data)
+        try:
+            os.rename(temp,path)
+        except OSError:
+            # already stored by another client, with the same results
+            os.remove(temp)
+        return True
+
+
+class shared_cache_client:
+
+    "A shared cache served by a shared cache server (see serve_shared_cache()), with the same methods as shared_cache_store"
+
+    def __init__(self,url):
+
+        self.url = url.rstrip("/")
+
+    def get(self,service,payload,token=None):
+
+        "Returns the stored results (bytes) for the given keys, or None"
+
+        try:
+            response = requests.get(self.url+"/"+service+"/"+payload,headers={"Authorization":"Bearer "+tostr(token or "")},
+                                    timeout=get_config_value("connection_timeout"))
+        except:
+            if DEBUG:
+                print("Error: unable to connect to shared cache at",self.url)
+            return None
+        return response.content if response.status_code == 200 else None
+
+    def put(self,service,payload,data,token=None):
+
+        "Stores the given results (bytes) under the given keys. Returns True if successful"
+
+        try:
+            response = requests.put(self.url+"/"+service+"/"+payload,data=data,headers={"Authorization":"Bearer "+tostr(token or "")},
+                                    timeout=get_config_value("connection_timeout"))
+        except:
+            if DEBUG:
+                print("Error: unable to connect to shared cache at",self.url)
+            return False
+        return response.ok
+
+
+def get_shared_cache():
+
+    """Returns the shared cache set in the shared_cache config value: a shared_cache_client if it is a
+    http(s) url, a shared_cache_store if it is a directory. Returns None if no shared cache is set"""
+
+    location = get_config_value("shared_cache")
+    if not location:
+        return None
+    if location.startswith("http://") or location.startswith("https://"):
+        return shared_cache_client(location)
+    return shared_cache_store(location)
+
+
+def get_shared_cache_token(provider_url,service_id):
+
+    "Returns the token to use with the shared cache for the given service: its cache_token, or the shared_cache_token config value"
+
+    service = get_service_config(provider_url,service_id)
+    if service and service.get("cache_token"):
+        return service['cache_token']
+    return get_config_value("shared_cache_token")
+
+
+def get_shared_results(provider_url,service_id,data):
+
+    "Returns the results of the given service on the given IFC data found in the shared cache, or None. Never fails"
+
+    try:
+        cache = get_shared_cache()
+        if not cache:
+            return None
+        service, payload = get_shared_cache_keys(provider_url,service_id,data)
+        results = cache.get(service,payload,get_shared_cache_token(provider_url,service_id))
+    except:
+        if DEBUG:
+            print("Error: unable to read the shared cache")
+        return None
+    if results is None:
+        return None
+    # results are stored as sent by the service
+    if results[:1] in (b"{",b"["):
+        try:
+            return json.loads(results.decode("utf8"))
+        except ValueError:
+            pass
+    return results
+
+
+def store_shared_results(provider_url,service_id,data,results):
+
+    "Stores the results of the given service on the given IFC data in the shared cache, if any. Never fails. Returns nothing"
+
+    try:
+        cache = get_shared_cache()
+        if not cache:
+            return
+        if get_result_type(results) == "json":
+            blob = json.dumps(results).encode("utf8")
+        else:
+            blob = results if isinstance(results,bytes) else tostr(results).encode("utf8")
+        service, payload = get_shared_cache_keys(provider_url,service_id,data)
+        cache.put(service,payload,blob,get_shared_cache_token(provider_url,service_id))
+    except:
+        if DEBUG:
+            print("Error: unable to write to the shared cache")
+
+
+def make_shared_cache_server(path,port=8090,tokens=None,host="127.0.0.1"):
+
+    """Returns a HTTP server (not yet started) serving the shared cache stored in the given directory
+    (see shared_cache_store). Results are read with GET /<service key>/<payload key> and stored with PUT,
+    with an "Authorization: Bearer <token>" header if tokens are given. By default, the server only
+    listens on the local host; give host="" to listen on every network interface"""
+
+    try:
+        from http.server import HTTPServer, BaseHTTPRequestHandler
+        from socketserver import ThreadingMixIn
+    except ImportError:
+        from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+        from SocketServer import ThreadingMixIn
+
+    store = shared_cache_store(path,tokens)
+
+    class shared_cache_handler(BaseHTTPRequestHandler):
+
+        protocol_version = "HTTP/1.1"
+
+        def get_request(self):
+
+            "Returns (service key, payload key, token) of the current request, or None if it is not valid"
+
+            keys = self.path.strip("/").split("/")
+            if (len(keys) != 2) or not store.get_path(keys[0],keys[1]):
+                self.reply(404)
+                return None
+            token = self.headers.get("Authorization","").replace("Bearer","",1).strip() or None
+            if not store.allowed(keys[0],token):
+                self.reply(403)
+                return None
+            return keys[0],keys[1],token
+
+        def reply(self,status,data=b""):
+
+            self.send_response(status)
+            self.send_header("Content-Type","application/octet-stream")
+            self.send_header("Content-Length",str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+
+            request = self.get_request()
+            if request:
+                data = store.get(*request)
+                if data is None:
+                    self.reply(404)
+                else:
+                    self.reply(200,data)
+
+        def do_PUT(self):
+
+            request = self.get_request()
+            data = self.rfile.read(int(self.headers.get("Content-Length",0)))
+            if request:
+                service, payload, token = request
+                self.reply(200 if store.put(service,payload,data,token) else 500)
+
+        def log_message(self,*args):
+
+            if DEBUG:
+                BaseHTTPRequestHandler.log_message(self,*args)
+
+    class shared_cache_server(ThreadingMixIn,HTTPServer):
+
+        daemon_threads = True
+
+    return shared_cache_server((host,port),shared_cache_handler)
+
+
+def serve_shared_cache(path,port=8090,tokens_file=None,host="127.0.0.1",anonymous=False):
+
+    """Serves the shared cache stored in the given directory until interrupted. The optional tokens file is
+    a json file {token: list of services or "*"} (see shared_cache_store). A cache without tokens is only
+    served on the local host, unless anonymous is True. Returns nothing"""
+
+    tokens = None
+    if tokens_file:
+        with open(tokens_file) as json_file:
+            tokens = json.load(json_file)
+    if (not tokens) and (host not in ("127.0.0.1","localhost","::1")) and not anonymous:
+        print("Error: a shared cache served on",host or "every interface","needs a tokens file, or --anonymous")
+        return
+    server = make_shared_cache_server(path,port,tokens,host)
+    print("Serving shared cache from",path,"on",(host or "every interface")+", port",port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+
+#############   Job queue - runs that survive restarts
+
+
+class job_queue:
+
+    """A queue of runs (jobs) stored in the history database, so submitted runs and their results
+    survive a restart or a crash. Payloads are copied to a jobs folder of the scratch space (which
+    is not subject to the quota) until their job is finished. Worker threads send the pending jobs,
+    at most max_jobs at a time. Each running job is owned by the queue that sends it, which updates
+    it every heartbeat seconds. Running jobs not updated for three heartbeats belong to a session that
+    crashed or was closed, and are set back to pending, so two sessions never send the same job.
+    Job states are: pending, running, done, failed and cancelled. A job is only started if its service
+    can take one more request (see get_concurrency()), otherwise the next pending jobs are tried.
+    Job results are stored in the history, the id of the run is kept in the job. If the history is
+    disabled, they are written to a file of the scratch space instead, whose path is kept in the job."""
+
+    keys = ["id","provider_url","service_id","payload","state","context_id","run_id","error","created","updated","owner","result"]
+    heartbeat = 30 # seconds between two updates of the running jobs
+
+    def __init__(self,path=None,max_jobs=None):
+
+        import socket
+        import threading
+        self.path = path
+        self.max_jobs = max_jobs or get_config_value("max_jobs")
+        self.lock = threading.Lock()
+        self.workers = []
+        self.pulse = None # the thread updating the running jobs of this queue
+        self.running = {} # service url: number of jobs being sent to it by this queue
+        self.owner = socket.gethostname()+":"+str(os.getpid())+":"+str(id(self))
+        self.folder = os.path.join(get_scratch_space().path,"jobs")
+        if not os.path.isdir(self.folder):
+            os.makedirs(self.folder)
+        self.reclaim()
+        self.remove_orphans()
+
+    def open(self):
+
+        "Opens the history database and creates the jobs table if needed. Returns a sqlite3 connection"
+
+        db = open_history(self.path)
+        db.execute("CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, provider_url TEXT, service_id TEXT, payload TEXT, state TEXT, context_id TEXT, run_id INTEGER, error TEXT, created REAL, updated REAL, owner TEXT, result TEXT)")
+        db.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id)")
+        columns = [row[1] for row in db.execute("PRAGMA table_info(jobs)")]
+        for column in ["owner","result"]:
+            if column not in columns:
+                # the jobs table was created by an older version
+                db.execute("ALTER TABLE jobs ADD COLUMN "+column+" TEXT")
+        return db
+
+    def reclaim(self):
+
+        "Sets the running jobs whose owner stopped updating them back to pending. Returns nothing"
+
+        db = self.open()
+        try:
+            with db:
+                db.execute("UPDATE jobs SET state = 'pending', owner = NULL WHERE state = 'running' AND (updated < ? OR owner IS NULL)",
+                           (time.time()-3*self.heartbeat,))
+        finally:
+            db.close()
+
+    def remove_orphans(self):
+
+        "Deletes the payload copies of the jobs folder that belong to no pending or running job. Returns nothing"
+
+        db = self.open()
+        try:
+            payloads = set([row[0] for row in db.execute("SELECT payload FROM jobs WHERE state IN ('pending','running')")])
+        finally:
+            db.close()
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder,name)
+            if name.startswith("job-") and (path not in payloads):
+                try:
+                    os.remove(path)
+                except OSError:
+                    # still being copied by submit()
+                    pass
+
+    def beat(self):
+
+        "The loop of the heartbeat thread: updates the running jobs of this queue until its workers are finished. Returns nothing"
+
+        while any(w.is_alive() for w in self.workers):
+            db = self.open()
+            try:
+                with db:
+                    db.execute("UPDATE jobs SET updated = ? WHERE owner = ? AND state = 'running'",(time.time(),self.owner))
+            finally:
+                db.close()
+            end = time.time() + self.heartbeat
+            while (time.time() < end) and any(w.is_alive() for w in self.workers):
+                time.sleep(0.5)
+
+    def remove_payload(self,job):
+
+        "Deletes the payload copy of the given job dict, if it still exists. Returns nothing"
+
+        if job['payload'] and os.path.exists(job['payload']):
+            try:
+                os.remove(job['payload'])
+            except OSError:
+                # still open by a worker, on Windows
+                pass
+
+    def submit(self,provider_url,service_id,file_path,context_id=None,start=True):
+
+        "Adds a job sending the given IFC file to the given service, and starts the workers if start is True. Returns the job id"
+
+        db = self.open()
+        try:
+            with db:
+                now = time.time()
+                job_id = db.execute("INSERT INTO jobs (provider_url, service_id, payload, state, context_id, created, updated) VALUES (?,?,?,?,?,?,?)",
+                                    (provider_url,tostr(service_id),file_path,"pending",context_id,now,now)).lastrowid
+                payload = os.path.join(self.folder,"job-"+str(job_id)+".ifc")
+                try:
+                    os.link(file_path,payload)
+                except (AttributeError,OSError):
+                    import shutil
+                    shutil.copyfile(file_path,payload)
+                db.execute("UPDATE jobs SET payload = ? WHERE id = ?",(payload,job_id))
+        finally:
+            db.close()
+        if start:
+            self.start()
+        return job_id
+
+    def update(self,job_id,**values):
+
+        "Sets the given values of the given job. Returns nothing"
+
+        values['updated'] = time.time()
+        names = sorted(values.keys())
+        db = self.open()
+        try:
+            with db:
+                db.execute("UPDATE jobs SET "+", ".join([n+" = ?" for n in names])+" WHERE id = ?",[values[n] for n in names]+[job_id])
+        finally:
+            db.close()
+
+    def get_endpoint(self,job,config=None):
+
+        """Returns the url the given job is sent to, or None if its service is not authenticated. The config
+        file is read unless its contents are given"""
+
+        service_id = job['service_id']
+        if service_id.isdigit():
+            service_id = int(service_id)
+        for service in (config or read_config())['services']:
+            if (service['provider_url'] == job['provider_url']) and (service['id'] == service_id) and ('token' in service):
+                return service['service_url']
+        return None
+
+    def claim(self):
+
+        """Marks the oldest pending job whose service can take one more request as running and returns it
+        as a dict, or returns None if there is no such job"""
+
+        with self.lock:
+            db = self.open()
+            try:
+                # the config file and the history are read once per service, not once per job
+                config = read_config()
+                endpoints = {}
+                limits = {}
+                while True:
+                    with db:
+                        for row in db.execute("SELECT "+", ".join(self.keys)+" FROM jobs WHERE state = 'pending' ORDER BY id").fetchall():
+                            job = dict(zip(self.keys,row))
+                            service = (job['provider_url'],job['service_id'])
+                            if service not in endpoints:
+                                endpoints[service] = self.get_endpoint(job,config)
+                            endpoint = endpoints[service]
+                            if endpoint not in limits:
+                                limits[endpoint] = get_concurrency(endpoint) if endpoint else 1
+                            if self.running.get(endpoint,0) < limits[endpoint]:
+                                break
+                        else:
+                            return None
+                        # another FreeCAD session might have claimed it meanwhile
+                        if db.execute("UPDATE jobs SET state = 'running', owner = ?, updated = ? WHERE id = ? AND state = 'pending'",(self.owner,time.time(),job['id'])).rowcount:
+                            break
+            finally:
+                db.close()
+            self.running[endpoint] = self.running.get(endpoint,0) + 1
+        job['state'] = "running"
+        job['endpoint'] = endpoint
+        return job
+
+    def run(self,job):
+
+        "Sends the given job and stores its outcome. Returns nothing"
+
+        service_id = job['service_id']
+        # service ids are ints in the config file
+        if service_id.isdigit():
+            service_id = int(service_id)
+        info = {}
+        try:
+            results = send_mirrored_payload(job['provider_url'],service_id,job['payload'],job['context_id'],info)
+        except Exception as e:
+            results = None
+            info['error'] = tostr(e)
+        state = self.get_job(job['id'])['state']
+        if state == "cancelled":
+            self.remove_payload(job)
+            return
+        if results:
+            result = None
+            if not info.get('run_id'):
+                # history is disabled, but the queue needs somewhere to keep the results
+                result = self.save_results(results)
+            self.update(job['id'],state="done",run_id=info.get('run_id'),result=result,context_id=info.get('context_id') or job['context_id'])
+        else:
+            self.update(job['id'],state="failed",error=info.get('error') or "No results obtained")
+        self.remove_payload(job)
+
+    def save_results(self,results):
+
+        "Writes the given results to a file of the scratch space. Returns the file path"
+
+        result_type = get_result_type(results)
+        if result_type == "json":
+            return get_scratch_space().write(json.dumps(results).encode("utf8"),".json")
+        if result_type == "bcf":
+            return get_scratch_space().write(results,".bcf")
+        return get_scratch_space().write(results if isinstance(results,bytes) else tostr(results).encode("utf8"),".txt")
+
+    def get_results(self,job):
+
+        "Returns the results of the given job dict, from the history or from its result file, or None if they are not available"
+
+        if job['run_id']:
+            return get_run_results(job['run_id'],self.path)
+        if job['result'] and os.path.exists(job['result']):
+            with open(job['result'],"rb") as result_file:
+                data = result_file.read()
+            if job['result'].endswith(".json"):
+                return json.loads(data.decode("utf8"))
+            if job['result'].endswith(".txt"):
+                return data.decode("utf8")
+            return data
+        return None
+
+    def work(self):
+
+        "The loop of a worker thread: runs pending jobs until there is none left. Returns nothing"
+
+        while True:
+            job = self.claim()
+            if not job:
+                break
+            try:
+                self.run(job)
+            finally:
+                with self.lock:
+                    self.running[job['endpoint']] -= 1
+
+    def start(self):
+
+        "Starts worker threads, up to max_jobs, if there are pending jobs, including jobs abandoned by other sessions. Returns nothing"
+
+        import threading
+        self.reclaim()
+        with self.lock:
+            self.workers = [w for w in self.workers if w.is_alive()]
+            for i in range(max(0,min(self.max_jobs,self.count("pending"))-len(self.workers))):
+                worker = threading.Thread(target=self.work)
+                worker.daemon = True
+                worker.start()
+                self.workers.append(worker)
+            if self.workers and not (self.pulse and self.pulse.is_alive()):
+                self.pulse = threading.Thread(target=self.beat)
+                self.pulse.daemon = True
+                self.pulse.start()
+
+    def wait(self,timeout=None):
+
+        "Waits until all workers are finished, or the given timeout in seconds is elapsed. Returns True if the queue is idle"
+
+        end = None if timeout is None else time.time() + timeout
+        for worker in list(self.workers):
+            worker.join(None if end is None else max(0,end-time.time()))
+        return not any(w.is_alive() for w in self.workers)
+
+    def cancel(self,job_id):
+
+        "Cancels the given job if it is pending or running, and deletes its payload copy. Returns nothing"
+
+        db = self.open()
+        try:
+            with db:
+                cancelled = db.execute("UPDATE jobs SET state = 'cancelled', updated = ? WHERE id = ? AND state IN ('pending','running')",(time.time(),job_id)).rowcount
+        finally:
+            db.close()
+        if cancelled:
+            self.remove_payload(self.get_job(job_id))
+
+    def get_job(self,job_id):
+
+        "Returns the given job as a dict {id,provider_url,service_id,payload,state,context_id,run_id,error,created,updated,owner,result}, or None"
+
+        db = self.open()
+        try:
+            row = db.execute("SELECT "+", ".join(self.keys)+" FROM jobs WHERE id = ?",(job_id,)).fetchone()
+        finally:
+            db.close()
+        return dict(zip(self.keys,row)) if row else None
+
+    def get_jobs(self,state=None,limit=None):
+
+        "Returns a list of job dicts (see get_job()), newest first, optionally only those in the given state"
+
+        query = "SELECT "+", ".join(self.keys)+" FROM jobs"
+        args = []
+        if state:
+            query += " WHERE state = ?"
+            args.append(state)
+        query += " ORDER BY id DESC"
+        if limit:
+            query += " LIMIT " + str(int(limit))
+        db = self.open()
+        try:
+            return [dict(zip(self.keys,row)) for row in db.execute(query,args)]
+        finally:
+            db.close()
+
+    def count(self,state):
+
+        "Returns the number of jobs in the given state"
+
+        db = self.open()
+        try:
+            return db.execute("SELECT COUNT(*) FROM jobs WHERE state = ?",(state,)).fetchone()[0]
+        finally:
+            db.close()
+
+    def get_status(self):
+
+        "Returns a dict {state: number of jobs}"
+
+        db = self.open()
+        try:
+            return dict(db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+        finally:
+            db.close()
+
+
+# the job queue of this session, created when first needed
+queue = None
+
+
+def get_job_queue():
+
+    "Returns the job queue of this session. Creating it resumes the jobs left pending by a previous session"
+
+    global queue
+    if queue is None:
+        queue = job_queue()
+        queue.start()
+    return queue
+
+
+def submit_job(provider_url,service_id,file_path,context_id=None):
+
+    "Queues a run of the given service on the given IFC file. Returns the job id. See job_queue"
+
+    return get_job_queue().submit(provider_url,service_id,file_path,context_id)
+
+
+def get_job_status():
+
+    "Returns a dict {state: number of jobs} describing the job queue"
+
+    return get_job_queue().get_status()
+
+
+
+#############   Model splitting - parts of a model sent in parallel
+
+
+def is_split_safe(provider_url,service_id):
+
+    """Returns True if the given service has been declared split-safe in the config file, that is, if
+    it analyses each element independently and can be given parts of a model instead of the whole model"""
+
+    service = get_service_config(provider_url,service_id)
+    return bool(service and service.get("split_safe"))
+
+
+def set_split_safe(provider_url,service_id,split_safe=True):
+
+    "Declares the given (authenticated) service as split-safe or not in the config file. Returns nothing"
+
+    config = read_config()
+    for service in config['services']:
+        if (service['provider_url'] == provider_url) and (service['id'] == service_id):
+            service['split_safe'] = bool(split_safe)
+            save_config(config)
+            return
+    if DEBUG:
+        print("Error: service",service_id,"of",provider_url,"not found in config")
+
+
+def mask_ifc_strings(text):
+
+    "Returns the given IFC text with the contents of its strings replaced by underscores, so they can't be mistaken for references"
+
+    import re
+    if "'" not in text:
+        return text
+    return re.sub("'(?:[^']|'')*'",lambda m: "'"+"_"*(len(m.group(0))-2)+"'",text)
+
+
+def read_ifc_entities(data):
+
+    """Reads the DATA section of the given IFC data (file contents as a string). Returns a (header, entities,
+    footer) tuple, where header and footer are the texts before and after the DATA section, and entities a
+    list of (id, ifc type, text) tuples, in file order. The text of each entity includes the final semicolon."""
+
+    import re
+    start = re.search("(?m)^\\s*DATA\\s*;",data)
+    end = data.rfind("ENDSEC;")
+    if (not start) or (end < start.end()):
+        return data,[],""
+    entity = re.compile("\\s*#(\\d+)\\s*=\\s*(\\w+)")
+    entities = []
+    position = start.end()
+    # semicolons inside strings don't end a statement
+    for match in re.finditer("'(?:[^']|'')*'|;",data[:end]):
+        if match.group(0) == ";" and match.start() >= position:
+            text = data[position:match.end()].strip()
+            position = match.end()
+            head = entity.match(text)
+            if head:
+                entities.append((int(head.group(1)),head.group(2).upper(),text))
+    return data[:start.end()],entities,data[end:]
+
+
+def get_entity_refs(text):
+
+    "Returns the list of ids referenced by the given IFC entity text"
+
+    import re
+    return [int(i) for i in re.findall("#(\\d+)",mask_ifc_strings(text)[text.index("="):])]
+
+
+def get_entity_args(text):
+
+    "Returns the list of the top-level attributes of the given IFC entity text, as strings"
+
+    masked = mask_ifc_strings(text)
+    args = []
+    depth = 0
+    begin = None
+    for i, char in enumerate(masked):
+        if char == "(":
+            depth += 1
+            if depth == 1:
+                begin = i+1
+        elif char == ")":
+            depth -= 1
+            if depth == 0:
+                args.append(text[begin:i].strip())
+                break
+        elif (char == ",") and (depth == 1):
+            args.append(text[begin:i].strip())
+            begin = i+1
+    return args
+
+
+def filter_entity_refs(text,ids):
+
+    """Returns the given IFC entity text with the given ids removed from its lists of references, or None
+    if the entity can't do without them: they are single attributes, or all the members of a list"""
+
+    import re
+    masked = mask_ifc_strings(text)
+    spans = []
+    for match in re.finditer("\\((\\s*#\\d+(?:\\s*,\\s*#\\d+)*\\s*)\\)",masked):
+        members = [m.strip() for m in match.group(1).split(",")]
+        kept = [m for m in members if int(m[1:]) not in ids]
+        if len(kept) < len(members):
+            if not kept:
+                return None
+            spans.append((match.start(),match.end(),"("+",".join(kept)+")"))
+    for match in re.finditer("#(\\d+)",masked[masked.index("="):]):
+        if int(match.group(1)) in ids:
+            position = match.start() + masked.index("=")
+            if not any(s[0] < position < s[1] for s in spans):
+                return None
+    for begin, end, replacement in reversed(spans):
+        text = text[:begin] + replacement + text[end:]
+    return text
+
+
+def split_ifc_data(data,by="storey"):
+
+    """Splits the given IFC data (file contents as a string) into independent parts, one for each building
+    storey (by="storey") or for each spatial structure element containing elements (by="space"). Each part
+    is a valid IFC file holding the whole spatial structure, the contained elements of its storey or space
+    and everything they use (openings, fillings, parts, geometry, properties...). Elements keep their GUID.
+    Returns a list of (name, data) tuples, with a single (None, data) item if the model can't be split."""
+
+    header, entities, footer = read_ifc_entities(data)
+    texts = {}
+    types = {}
+    refs = {}
+    referrers = {}
+    for eid, ifc_type, text in entities:
+        texts[eid] = text
+        types[eid] = ifc_type
+        refs[eid] = get_entity_refs(text)
+        for ref in refs[eid]:
+            referrers.setdefault(ref,[]).append(eid)
+    def get_ids(arg):
+        return [int(i) for i in arg.replace("(","").replace(")","").replace("#","").split(",") if i.strip().isdigit()]
+    # spatial parents and element dependencies (parts, openings, fillings)
+    parents = {}
+    dependents = {}
+    containers = []
+    for eid, ifc_type, text in entities:
+        if ifc_type in ("IFCRELAGGREGATES","IFCRELNESTS","IFCRELVOIDSELEMENT","IFCRELFILLSELEMENT","IFCRELCONTAINEDINSPATIALSTRUCTURE"):
+            args = get_entity_args(text)
+            if len(args) < 6:
+                continue
+            if ifc_type == "IFCRELCONTAINEDINSPATIALSTRUCTURE":
+                containers.extend([(get_ids(args[5])[0],element) for element in get_ids(args[4])])
+            else:
+                for relating in get_ids(args[4]):
+                    for related in get_ids(args[5]):
+                        parents[related] = relating
+                        dependents.setdefault(relating,[]).append(related)
+    def get_part(structure):
+        if by == "storey":
+            ancestor = structure
+            while ancestor is not None:
+                if types.get(ancestor) == "IFCBUILDINGSTOREY":
+                    return ancestor
+                ancestor = parents.get(ancestor)
+        return structure
+    parts = {}
+    owner = {}
+    for structure, element in containers:
+        part = get_part(structure)
+        todo = [element]
+        while todo:
+            item = todo.pop()
+            if item not in owner:
+                owner[item] = part
+                parts.setdefault(part,[]).append(item)
+                todo.extend(dependents.get(item,[]))
+    if len(parts) < 2:
+        return [(None,data)]
+    result = []
+    for part in sorted(parts.keys()):
+        # remove the elements of the other parts and whatever can't do without them
+        dropped = set([e for e in owner if owner[e] != part])
+        modified = {}
+        todo = list(dropped)
+        while todo:
+            for eid in referrers.get(todo.pop(),[]):
+                if eid not in dropped:
+                    text = filter_entity_refs(modified.get(eid,texts[eid]),dropped)
+                    if text is None:
+                        dropped.add(eid)
+                        todo.append(eid)
+                    else:
+                        modified[eid] = text
+        # keep what is reachable from the project and the relationships
+        kept = set()
+        todo = [e for e in texts if (e not in dropped) and (types[e] == "IFCPROJECT" or types[e].startswith("IFCREL"))]
+        while todo:
+            eid = todo.pop()
+            if eid not in kept:
+                kept.add(eid)
+                todo.extend(refs[eid] if eid not in modified else get_entity_refs(modified[eid]))
+        # and the unreferenced entities (styles, layers...) that still point to kept entities
+        for eid in texts:
+            if (eid not in kept) and (eid not in dropped) and (not referrers.get(eid)):
+                missing = set(refs[eid]) - kept
+                if missing:
+                    text = filter_entity_refs(modified.get(eid,texts[eid]),missing)
+                    if text is None:
+                        continue
+                    modified[eid] = text
+                kept.add(eid)
+        name = get_entity_args(texts[part])[2] if part in texts else "$"
+        name = name[1:-1].replace("''","'") if name.startswith("'") else tostr(part)
+        body = "\n".join([modified.get(eid,text) for eid, ifc_type, text in entities if eid in kept])
+        result.append((name,header+"\n"+body+"\n"+footer))
+    return result
+
+
+def split_ifc_file(file_path,by="storey"):
+
+    """Splits the given IFC file into parts written to the scratch space (see split_ifc_data()).
+    Returns a list of (name, file path) tuples. FreeCAD objects can be split by exporting them first (see export_ifc())"""
+
+    with open(file_path) as file_stream:
+        data = file_stream.read()
+    scratch = get_scratch_space()
+    parts = []
+    for name, part in split_ifc_data(data,by):
+        path = scratch.new_file(".ifc")
+        with open(path,"wb") as part_file:
+            part_file.write(part if isinstance(part,bytes) else part.encode("utf8"))
+        parts.append((name,path))
+    scratch.cleanup(keep=[p[1] for p in parts])
+    return parts
+
+
+def get_result_key(data):
+
+    """Returns a key identifying the given json result item: its GUID if it has one, its name if it
+    is a dict having a name (classification, material...), or its contents"""
+
+    guid = get_result_guid(data)
+    if guid:
+        return "guid:"+tostr(guid)
+    if isinstance(data,dict) and isinstance(data.get("name"),(str,type(u""))):
+        return "name:"+tostr(data['name'])
+    return json.dumps(data,sort_keys=True)
+
+
+def is_count_key(key):
+
+    "Returns True if the given json key holds a number of elements (numberOfObjects, nrOfProducts, count...)"
+
+    key = tostr(key).lower()
+    return key.startswith(("numberof","nrof","totalnumberof","count")) or key.endswith("count")
+
+
+def is_average_key(key):
+
+    "Returns True if the given json key holds an average value (averageNumberOfTriangles...)"
+
+    return tostr(key).lower().startswith(("average","avg","mean"))
+
+
+def get_top_size(key):
+
+    "Returns N if the given json key holds a top-N list (topTenMostComplexObjects, top10...), or None"
+
+    import re
+    numbers = {"three":3,"five":5,"ten":10,"twenty":20,"fifty":50,"hundred":100}
+    match = re.match("top_?([0-9]+|"+"|".join(numbers)+")",tostr(key),re.I)
+    if not match:
+        return None
+    size = match.group(1).lower()
+    return int(size) if size.isdigit() else numbers[size]
+
+
+def merge_json_results(results,key=None):
+
+    """Merges the given list of json results obtained from parts of a model (see split_ifc_data()).
+    Each part holds the whole spatial structure and its own elements, so:
+    - counts of elements (see is_count_key()) are added up, other numbers are taken from the first part
+    - averages are recomputed, weighted by the count found next to them (numberOfObjects...)
+    - per-type entries of the spatial structure (IfcProject, IfcSite, IfcBuilding...) are taken from the first part
+    - list items with the same GUID or name are merged once (identical items with a GUID are kept as they are)
+    - top-N lists are sorted again by their first count and cut back to N items
+    The key argument is the json key holding the given results, if any. Returns the merged result"""
+
+    spatial_types = ("ifcproject","ifcsite","ifcbuilding","ifcbuildingstorey","ifcspace")
+    results = [r for r in results if r is not None]
+    if not results:
+        return None
+    if len(results) == 1:
+        return results[0]
+    if all([isinstance(r,dict) for r in results]):
+        merged = {}
+        averages = []
+        for result in results:
+            for name in result:
+                if name in merged:
+                    continue
+                values = [r[name] for r in results if name in r]
+                if tostr(name).lower() in spatial_types:
+                    merged[name] = values[0]
+                elif is_average_key(name) and all([is_number(v) for v in values]):
+                    # computed once the counts are known
+                    averages.append(name)
+                    merged[name] = None
+                else:
+                    merged[name] = merge_json_results(values,name)
+        if averages:
+            counts = [n for n in merged if is_count_key(n) and is_number(merged[n])]
+            count = "numberOfObjects" if "numberOfObjects" in counts else (counts[0] if counts else None)
+            for name in averages:
+                pairs = [(r[name],r.get(count)) for r in results if name in r]
+                if all([is_number(w) for v, w in pairs]) and sum([w for v, w in pairs]):
+                    merged[name] = float(sum([v*w for v, w in pairs]))/sum([w for v, w in pairs])
+                else:
+                    merged[name] = float(sum([v for v, w in pairs]))/len(pairs)
+                if all([isinstance(v,int) for v, w in pairs]) and merged[name] == int(merged[name]):
+                    merged[name] = int(merged[name])
+        return merged
+    if all([isinstance(r,list) for r in results]):
+        groups = {}
+        order = []
+        for result in results:
+            for item in result:
+                item_key = get_result_key(item)
+                if item_key not in groups:
+                    groups[item_key] = []
+                    order.append(item_key)
+                groups[item_key].append(item)
+        merged = []
+        for item_key in order:
+            items = groups[item_key]
+            if item_key.startswith("guid:"):
+                # the spatial structure and its issues are repeated as they are in every part
+                unique = []
+                for item in items:
+                    if item not in unique:
+                        unique.append(item)
+                items = unique
+            merged.append(merge_json_results(items))
+        size = get_top_size(key) if key else None
+        if size:
+            if all([isinstance(i,dict) for i in merged]):
+                # sort by a number found in every item, counts first
+                names = [n for n in merged[0] if all([is_number(i.get(n)) for i in merged])]
+                names.sort(key=lambda n: not is_count_key(n))
+                if names:
+                    merged.sort(key=lambda i: i[names[0]],reverse=True)
+            merged = merged[:size]
+        return merged
+    if key and is_count_key(key) and all([is_number(r) for r in results]):
+        return sum(results)
+    return results[0]
+
+
+def merge_bcf_results(results):
+
+    "Merges the given list of BCF zip files contents. Topics are kept once per GUID. Returns the merged contents"
+
+    import io
+    output = io.BytesIO()
+    names = set()
+    merged = zipfile.ZipFile(output,"w",zipfile.ZIP_DEFLATED)
+    for data in results:
+        bcf = zipfile.ZipFile(io.BytesIO(data))
+        for entry in bcf.infolist():
+            # topic folders are named after the topic GUID
+            if entry.filename not in names:
+                names.add(entry.filename)
+                merged.writestr(entry,bcf.read(entry))
+    merged.close()
+    return output.getvalue()
+
+
+def merge_results(results):
+
+    "Merges the given list of results obtained from parts of a model into one result of the same type"
+
+    result_types = set([get_result_type(r) for r in results])
+    if result_types == set(["json"]):
+        return merge_json_results(results)
+    if result_types == set(["bcf"]):
+        return merge_bcf_results(results)
+    return "\n".join([r.decode("utf8","ignore") if isinstance(r,bytes) else tostr(r) for r in results])
+
+
+def send_split_payload(provider_url,service_id,file_path,by="storey",info=None):
+
+    """Splits the given IFC file by storey or space (see split_ifc_data()), sends the parts to the given
+    service at the same time, up to split_workers at once or less if the service can't take that many
+    (see get_concurrency()), and merges their results (see merge_results()).
+    The merged results are stored in the history as a run on the whole model. Returns the merged results,
+    or an empty dict if any part failed. If an info dict is given, it receives the id of the run (run_id)
+    and the names of the parts (parts)"""
+
+    import threading
+    with open(file_path) as file_stream:
+        data = file_stream.read()
+    cached = get_shared_results(provider_url,service_id,data)
+    if cached:
+        run_id = record_run(provider_url,service_id,data,cached)
+        if info is not None:
+            info['run_id'] = run_id
+            info['cached'] = True
+        return cached
+    parts = split_ifc_file(file_path,by)
+    if len(parts) < 2:
+        os.remove(parts[0][1])
+        return send_ifc_payload(provider_url,service_id,file_path,info=info)
+    results = [None] * len(parts)
+    todo = list(range(len(parts)))
+    lock = threading.Lock()
+    def work():
+        while True:
+            with lock:
+                if not todo:
+                    return
+                index = todo.pop(0)
+            try:
+                results[index] = send_ifc_payload(provider_url,service_id,parts[index][1],record=False)
+            except:
+                if DEBUG:
+                    print("Error: unable to send part",parts[index][0],"to service",service_id)
+    start = time.time()
+    service = get_service_config(provider_url,service_id)
+    count = min(len(parts),get_config_value("split_workers"),get_concurrency(service['service_url']) if service else 1)
+    workers = [threading.Thread(target=work) for i in range(count)]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+    for worker in workers:
+        worker.join()
+    duration = time.time() - start
+    for name, path in parts:
+        if os.path.exists(path):
+            os.remove(path)
+    if not all(results):
+        if DEBUG:
+            print("Error: some parts of",file_path,"got no results from service",service_id)
+        return {}
+    results = merge_results(results)
+    store_shared_results(provider_url,service_id,data,results)
+    run_id = record_run(provider_url,service_id,data,results,duration)
+    if info is not None:
+        info['run_id'] = run_id
+        info['parts'] = [name for name, path in parts]
+    return results
+
+
+
+#############   Results search - an inverted index over json results
+
+
+def get_search_tokens(text):
+
+    """Returns a set of lowercase search tokens for the given key or value: the whole text, its words
+    (camelCase and punctuation-separated) and, for IFC types, the type name without the Ifc prefix"""
+
+    import re
+    text = tostr(text)
+    tokens = set([text.lower()])
+    tokens.update([word.lower() for word in re.findall("[A-Z]+(?![a-z])|[A-Z]?[a-z0-9]+",text)])
+    for token in list(tokens):
+        if token.startswith("ifc") and (len(token) > 3):
+            tokens.add(token[3:])
+    tokens.discard("")
+    return tokens
+
+
+class result_index:
+
+    """An inverted index over json results, built once per result. Nodes are numbered in the order
+    the bimbots_panel.fill_item() creates tree items (sorted dict keys, list order), so node numbers
+    can be used to address the corresponding tree items. Each node is a dict key or a list index, and
+    its tokens are made of the key and, if the node holds a simple value, of that value."""
+
+    def __init__(self,results):
+
+        self.parents = [] # the parent node number of each node, -1 for top-level nodes
+        self.ends = [] # the number following the last descendant of each node
+        self.keys = [] # the key or list index of each node
+        self.values = [] # the simple value of each node, or None
+        self.links = [] # the link type of each node (uuid, name or type), or None
+        self.postings = {} # token: list of node numbers, only used while building
+        self._tokencache = {}
+        self.add(results,-1,None)
+        # freeze the postings into a sorted token list and one flat array of node numbers,
+        # so the nodes of all the tokens sharing a prefix are a single slice of that array
+        import array
+        self.tokens = sorted(self.postings.keys())
+        self.offsets = array.array("l",[0])
+        self.nodes = array.array("l")
+        for token in self.tokens:
+            self.nodes.extend(self.postings[token])
+            self.offsets.append(len(self.nodes))
+        self.postings = None
+        self._tokencache = None
+        self._last = [] # the token ranges of the terms of the last search
+
+    def add(self,value,parent,link):
+
+        "Adds the children of the given json value (dict or list) under the given parent node. Returns nothing"
+
+        if isinstance(value,dict):
+            items = sorted(value.items())
+        elif isinstance(value,list):
+            items = enumerate(value)
+        else:
+            return
+        for key, val in items:
+            node = len(self.parents)
+            self.parents.append(parent)
+            self.ends.append(None)
+            self.keys.append(key)
+            childlink = None
+            if isinstance(value,dict):
+                if tostr(key).lower() == "guid":
+                    childlink = "uuid"
+                elif (tostr(key).lower() == "name") and (tostr(val) != tostr(val).upper()):
+                    childlink = "name"
+                elif (tostr(key).lower() == "type") and tostr(val).lower().startswith("ifc"):
+                    childlink = "type"
+            if isinstance(val,(dict,list)):
+                self.values.append(None)
+                self.links.append(None)
+                tokens = self.get_tokens(key)
+            else:
+                self.values.append(val)
+                self.links.append(childlink)
+                tokens = self.get_tokens(key) | self.get_tokens(val)
+            for token in tokens:
+                self.postings.setdefault(token,[]).append(node)
+            self.add(val,node,childlink)
+            self.ends[node] = len(self.parents)
+
+    def get_tokens(self,text):
+
+        "Returns the search tokens of the given text, caching them since keys and many values repeat a lot"
+
+        if text not in self._tokencache:
+            self._tokencache[text] = frozenset(get_search_tokens(text))
+        return self._tokencache[text]
+
+    def __len__(self):
+
+        return len(self.parents)
+
+    def get_range(self,term,lo=0,hi=None):
+
+        "Returns the (first,last+1) range of tokens starting with the given lowercase term, searching between lo and hi"
+
+        import bisect
+        if hi is None:
+            hi = len(self.tokens)
+        first = bisect.bisect_left(self.tokens,term,lo,hi)
+        # all tokens starting with term sort before term followed by the highest character
+        last = bisect.bisect_left(self.tokens,term+u"\uffff",first,hi)
+        return (first,last)
+
+    def lookup(self,term,lo=0,hi=None):
+
+        "Returns the set of nodes having a token starting with the given lowercase term"
+
+        first, last = self.get_range(term,lo,hi)
+        return set(self.nodes[self.offsets[first]:self.offsets[last]])
+
+    def search(self,text):
+
+        """Returns the set of nodes matching all the words of the given text (each word must start one
+        of the node tokens), or None if the text is empty. When a word only extends the same word of
+        the previous search (typical when typing), only the tokens found previously are searched."""
+
+        terms = tostr(text).lower().split()
+        if not terms:
+            self._last = []
+            return None
+        nodes = None
+        ranges = []
+        for i, term in enumerate(terms):
+            lo, hi = 0, len(self.tokens)
+            if (i < len(self._last)) and term.startswith(self._last[i][0]):
+                lo, hi = self._last[i][1]
+            first, last = self.get_range(term,lo,hi)
+            ranges.append((term,(first,last)))
+            found = set(self.nodes[self.offsets[first]:self.offsets[last]])
+            nodes = found if nodes is None else (nodes & found)
+        self._last = ranges
+        return nodes
+
+    def get_visible(self,nodes):
+
+        "Returns the set of nodes that must be shown to display the given nodes: the nodes, their ancestors and their descendants"
+
+        visible = set()
+        for node in nodes:
+            if node in visible:
+                continue
+            visible.update(range(node,self.ends[node]))
+            parent = self.parents[node]
+            while (parent >= 0) and (parent not in visible):
+                visible.add(parent)
+                parent = self.parents[parent]
+        return visible
+
+    def get_links(self,nodes):
+
+        """Returns a dict {uuid,name,type} of sets of linked values found among the given nodes and their
+        descendants. For nodes holding a simple value, the whole element they belong to is taken."""
+
+        links = {"uuid":set(),"name":set(),"type":set()}
+        for node in nodes:
+            if (self.values[node] is not None) and (self.parents[node] >= 0):
+                # a simple value: take the whole element it belongs to
+                node = self.parents[node]
+            for n in range(node,self.ends[node]):
+                if self.links[n]:
+                    links[self.links[n]].add(tostr(self.values[n]))
+        return links
+
+
+
+#############   Results tables - column-oriented storage of list-shaped results
+
+
+class result_table:
+
+    """A column-oriented table, used to store homogeneous lists found in json results (a list of dicts,
+    or a dict of dicts such as perType aggregations). Columns only containing numbers are stored as
+    array('d') with NaN for missing values, other columns as plain lists with None for missing values."""
+
+    def __init__(self,columns,data):
+
+        "Creates a table from a list of column names and a list of columns (lists of values)"
+
+        import array
+        self.columns = list(columns)
+        self.data = []
+        for values in data:
+            if values and all(is_number(v) or (v is None) for v in values) and any(v is not None for v in values):
+                values = array.array("d",[float("nan") if v is None else v for v in values])
+            self.data.append(values)
+        self.rows = len(self.data[0]) if self.data else 0
+        self._orders = {}
+        self._texts = {}
+
+    def __len__(self):
+
+        return self.rows
+
+    def is_numeric(self,column):
+
+        "Returns True if the given column (index) holds numbers"
+
+        return not isinstance(self.data[column],list)
+
+    def get_value(self,row,column):
+
+        "Returns the value at the given row and column (indices). Missing values are returned as None"
+
+        import math
+        value = self.data[column][row]
+        if self.is_numeric(column):
+            if math.isnan(value):
+                return None
+            if (not math.isinf(value)) and (value == int(value)):
+                return int(value)
+        return value
+
+    def get_column(self,name):
+
+        "Returns the values of the given column (name)"
+
+        return self.data[self.columns.index(name)]
+
+    def get_texts(self,column):
+
+        "Returns the given column (index) as a list of lowercase strings, used for filtering"
+
+        if column not in self._texts:
+            self._texts[column] = [tostr(self.get_value(row,column)).lower() for row in range(self.rows)]
+        return self._texts[column]
+
+    def sort_order(self,column,reverse=False):
+
+        "Returns the list of row indices sorted by the given column (index). Missing values come last. Orders are cached"
+
+        if column not in self._orders:
+            values = self.data[column]
+            if self.is_numeric(column):
+                order = sorted([r for r in range(self.rows) if values[r] == values[r]],key=values.__getitem__)
+            else:
+                present = [r for r in range(self.rows) if values[r] is not None]
+                try:
+                    order = sorted(present,key=values.__getitem__)
+                except TypeError:
+                    # mixed types
+                    order = sorted(present,key=lambda r: tostr(values[r]))
+            missing = [r for r in range(self.rows) if (values[r] is None) or (values[r] != values[r])]
+            self._orders[column] = (order,missing)
+        order, missing = self._orders[column]
+        if reverse:
+            return order[::-1] + missing
+        return order + missing
+
+    def filter_rows(self,text,rows=None,column=None):
+
+        """Returns the list of row indices (among the given rows, or all rows) where the given column (index)
+        or any column contains all the words of the given text, case insensitive"""
+
+        terms = tostr(text).lower().split()
+        if rows is None:
+            rows = range(self.rows)
+        if not terms:
+            return list(rows)
+        if column is None:
+            # search in all columns at once, joined with a character that can't be typed
+            if None not in self._texts:
+                columns = [self.get_texts(c) for c in range(len(self.columns))]
+                self._texts[None] = ["\n".join(values) for values in zip(*columns)]
+            texts = self._texts[None]
+        else:
+            texts = self.get_texts(column)
+        for term in terms:
+            rows = [r for r in rows if term in texts[r]]
+        return rows
+
+    def group_counts(self,column,rows=None):
+
+        "Returns a new result_table with two columns: the distinct values of the given column (index) and their number of rows, most frequent first"
+
+        counts = {}
+        for r in (range(self.rows) if rows is None else rows):
+            value = self.get_value(r,column)
+            counts[value] = counts.get(value,0) + 1
+        items = sorted(counts.items(),key=lambda item: -item[1])
+        return result_table([self.columns[column],"count"],[[i[0] for i in items],[i[1] for i in items]])
+
+    @staticmethod
+    def from_records(records,key_column=None):
+
+        """Creates a table from a list of dicts, or from a dict of dicts, in which case the dict keys are
+        stored in a first column named key_column. Only simple (non dict or list) values become columns."""
+
+        keys = None
+        if isinstance(records,dict):
+            keys = list(sorted(records.keys()))
+            records = [records[k] for k in keys]
+        columns = []
+        seen = set()
+        for record in records:
+            for name, value in record.items():
+                if (name not in seen) and not isinstance(value,(dict,list)):
+                    seen.add(name)
+                    columns.append(name)
+        data = [[record.get(name) for record in records] for name in columns]
+        for column in data:
+            for i, value in enumerate(column):
+                if isinstance(value,(dict,list)):
+                    column[i] = None
+        if keys is not None:
+            columns.insert(0,key_column or "key")
+            data.insert(0,keys)
+        return result_table(columns,data)
+
+
+def find_tables(results,min_rows=2,path=""):
+
+    """Returns a list of (path,result_table) tuples for each homogeneous list found in the given json
+    results: lists of dicts and dicts of dicts, having at least min_rows rows and one simple value column"""
+
+    tables = []
+    items = []
+    if isinstance(results,dict):
+        items = sorted(results.items())
+        records = list(results.values())
+        if (len(records) >= min_rows) and all(isinstance(r,dict) for r in records):
+            # dicts of dicts are usually keyed by ifc type (perType) or by name
+            keys = [tostr(k).lower() for k in results.keys()]
+            table = result_table.from_records(results,"type" if all(k.startswith("ifc") for k in keys) else "name")
+            if len(table.columns) > 1:
+                tables.append((path,table))
+    elif isinstance(results,list):
+        items = enumerate(results)
+        if (len(results) >= min_rows) and all(isinstance(r,dict) for r in results):
+            table = result_table.from_records(results)
+            if table.columns:
+                tables.append((path,table))
+    for key, val in items:
+        if isinstance(val,(dict,list)):
+            tables.extend(find_tables(val,min_rows,path+"/"+tostr(key)))
+    return tables
+
+
+
+#############   Results aggregation - statistics across many runs and models
+
+
+def get_percentile(values,percent):
+
+    "Returns the given percentile (0-100) of a sorted list of numbers, with linear interpolation"
+
+    if not values:
+        return None
+    position = (len(values)-1) * percent / 100.0
+    lower = int(position)
+    upper = min(lower+1,len(values)-1)
+    return values[lower] + (values[upper]-values[lower]) * (position-lower)
+
+
+class results_aggregator:
+
+    """Collects the numbers found in the tables (see find_tables()) of many json results into flat
+    columns, one row per number: run, model, timestamp, path (the table location in the results,
+    without list indices, ex. /aggregations/perType), group (the row type or name, ex. IfcWall),
+    metric (the column name, ex. numberOfObjects) and value. Text columns are stored as integer
+    codes in array('l'), numbers in array('d'), so results from thousands of runs stay compact."""
+
+    dimensions = ["run","model","path","group","metric"]
+
+    def __init__(self):
+
+        import array
+        self.strings = [] # the texts referenced by codes
+        self.codes = {} # text: code
+        self.run = array.array("l")
+        self.model = array.array("l")
+        self.path = array.array("l")
+        self.group = array.array("l")
+        self.metric = array.array("l")
+        self.timestamp = array.array("d")
+        self.value = array.array("d")
+
+    def __len__(self):
+
+        return len(self.value)
+
+    def get_code(self,text):
+
+        "Returns the integer code of the given text, adding it if needed"
+
+        code = self.codes.get(text)
+        if code is None:
+            code = len(self.strings)
+            self.codes[text] = code
+            self.strings.append(text)
+        return code
+
+    def add(self,results,run=0,model=None,timestamp=0.0):
+
+        "Adds the numbers found in the tables of the given json results. Returns the number of rows added"
+
+        count = 0
+        model = self.get_code(model or "")
+        for path, table in find_tables(results,min_rows=1):
+            path = self.get_code("/".join([p for p in path.split("/") if not p.isdigit()]))
+            for key in ("type","name"):
+                if key in table.columns:
+                    groups = [self.get_code(tostr(g)) for g in table.get_column(key)]
+                    break
+            else:
+                continue
+            for column, name in enumerate(table.columns):
+                if table.is_numeric(column):
+                    metric = self.get_code(tostr(name))
+                    values = table.data[column]
+                    rows = [r for r in range(len(table)) if values[r] == values[r]]
+                    self.run.extend([run]*len(rows))
+                    self.model.extend([model]*len(rows))
+                    self.path.extend([path]*len(rows))
+                    self.metric.extend([metric]*len(rows))
+                    self.timestamp.extend([timestamp]*len(rows))
+                    self.group.extend([groups[r] for r in rows])
+                    self.value.extend([values[r] for r in rows])
+                    count += len(rows)
+        return count
+
+    def add_history(self,provider_url=None,service_id=None,model=None,path=None):
+
+        "Adds all the json results stored in the history database for the given service and/or model. Returns the number of runs added"
+
+        count = 0
+        for run in get_runs(provider_url,service_id,model,path=path):
+            if run['result_type'] == "json":
+                self.add(get_run_results(run['id'],path),run['id'],run['model'],run['timestamp'])
+                count += 1
+        return count
+
+    def select(self,**filters):
+
+        "Returns the list of row indices matching the given filters, ex. metric=\"numberOfObjects\", group=\"IfcWall\""
+
+        rows = None
+        for dimension, text in filters.items():
+            if dimension == "run":
+                code = text
+            elif text in self.codes:
+                code = self.codes[text]
+            else:
+                return []
+            column = getattr(self,dimension)
+            if rows is None:
+                rows = [r for r in range(len(column)) if column[r] == code]
+            else:
+                rows = [r for r in rows if column[r] == code]
+        return list(range(len(self.value))) if rows is None else rows
+
+    def group_stats(self,by=("path","group","metric"),percentiles=(50,90),**filters):
+
+        """Returns a result_table with, for each distinct combination of the given dimensions, the count,
+        sum, mean, min, max and the given percentiles of the values. Filters restrict the rows used (see select())"""
+
+        groups = {}
+        columns = [getattr(self,dimension) for dimension in by]
+        for r in self.select(**filters):
+            key = tuple([column[r] for column in columns])
+            groups.setdefault(key,[]).append(self.value[r])
+        keys = sorted(groups.keys())
+        data = []
+        for i, dimension in enumerate(by):
+            if dimension == "run":
+                data.append([key[i] for key in keys])
+            else:
+                data.append([self.strings[key[i]] for key in keys])
+        stats = [[],[],[],[],[]]+[[] for p in percentiles]
+        for key in keys:
+            values = sorted(groups[key])
+            total = sum(values)
+            for column, value in zip(stats,[len(values),total,total/len(values),values[0],values[-1]]+[get_percentile(values,p) for p in percentiles]):
+                column.append(value)
+        names = list(by)+["count","sum","mean","min","max"]+["p"+str(p) for p in percentiles]
+        return result_table(names,data+stats)
+
+    def trend(self,metric,**filters):
+
+        "Returns a result_table (timestamp, model, run, value) with the sum of the given metric in each run, oldest first"
+
+        totals = {}
+        for r in self.select(metric=metric,**filters):
+            run = self.run[r]
+            if run not in totals:
+                totals[run] = [self.timestamp[r],self.strings[self.model[r]],0.0]
+            totals[run][2] += self.value[r]
+        runs = sorted(totals.keys(),key=lambda run: (totals[run][0],run))
+        return result_table(["timestamp","model","run","value"],
+                            [[totals[r][0] for r in runs],[totals[r][1] for r in runs],runs,[totals[r][2] for r in runs]])
+
+
+def export_csv(table,file_path):
+
+    "Writes the given result_table to a CSV file. Returns nothing"
+
+    import csv
+    if sys.version_info.major < 3:
+        csv_file = open(file_path,"wb")
+    else:
+        csv_file = open(file_path,"w",newline="")
+    with csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(table.columns)
+        for row in range(len(table)):
+            writer.writerow(["" if v is None else v for v in [table.get_value(row,c) for c in range(len(table.columns))]])
+
+
+
+#############   FreeCAD UI panel
+
+
+def launch_ui():
+
+    "Opens the BIMbots task panel in FreeCAD"
+
+    FreeCADGui.Control.showDialog(bimbots_panel())
+
+
+# objects created once per FreeCAD session and reused each time the panel is opened
+ui_cache = {"form_class":None,"icons":{},"translations":False,"watcher":None}
+
+
+def get_form():
+
+    """Returns a new instance of the bimbots.ui form. The ui file is compiled into a form class only
+    once per session, then that class is reused. Widgets are automatically named from the ui file."""
+
+    ui_file = os.path.join(os.path.dirname(__file__),"bimbots.ui")
+    if ui_cache["form_class"] is None:
+        try:
+            ui_class, base_class = FreeCADGui.PySideUic.loadUiType(ui_file)
+        except:
+            # loadUiType is not available everywhere, load the ui file each time then
+            return FreeCADGui.PySideUic.loadUi(ui_file)
+        class form_class(base_class,ui_class):
+            def __init__(self):
+                base_class.__init__(self)
+                self.setupUi(self)
+        ui_cache["form_class"] = form_class
+    return ui_cache["form_class"]()
+
+
+def get_icon(name):
+
+    "Returns a QIcon from the given file name in the icons folder, or a FreeCAD resource path starting with :/. Icons are loaded only once"
+
+    if name not in ui_cache["icons"]:
+        if name.startswith(":"):
+            ui_cache["icons"][name] = QtGui.QIcon(name)
+        else:
+            ui_cache["icons"][name] = QtGui.QIcon(os.path.join(os.path.dirname(__file__),"icons",name))
+    return ui_cache["icons"][name]
+
+
+class document_watcher:
+
+    "A FreeCAD document observer that counts the changes made to each document"
+
+    def __init__(self):
+
+        self.revisions = {} # document name: number of changes
+        self.listeners = [] # functions called with the document each time it changes
+        self.paused = False # changes are ignored while True, ex. while exporting
+
+    def touch(self,doc):
+
+        if self.paused:
+            return
+        self.revisions[doc.Name] = self.revisions.get(doc.Name,0) + 1
+        for listener in self.listeners:
+            listener(doc)
+
+    def slotCreatedObject(self,obj):
+
+        self.touch(obj.Document)
+
+    def slotDeletedObject(self,obj):
+
+        self.touch(obj.Document)
+
+    def slotChangedObject(self,obj,prop):
+
+        self.touch(obj.Document)
+
+    def slotDeletedDocument(self,doc):
+
+        self.revisions.pop(doc.Name,None)
+
+    def get_revision(self,doc):
+
+        "Returns the number of changes made to the given document since it was watched"
+
+        return self.revisions.get(doc.Name,0)
+
+
+def get_document_watcher():
+
+    "Returns the document_watcher of this session, creating and registering it if needed"
+
+    if ui_cache.get("watcher") is None:
+        ui_cache["watcher"] = document_watcher()
+        FreeCAD.addDocumentObserver(ui_cache["watcher"])
+    return ui_cache["watcher"]
+
+
+def get_export_key(objectslist):
+
+    """Returns a string identifying an export of the given objects in the current state of their
+    document, or None if the objects can't be tracked. Documents are only tracked once watched, and
+    documents changed since a previous export give a different key."""
+
+    if not objectslist:
+        return None
+    doc = objectslist[0].Document
+    watcher = get_document_watcher()
+    if doc.Name not in watcher.revisions:
+        # start counting now; the state before this point is unknown
+        watcher.revisions[doc.Name] = 0
+    return "|".join([tostr(doc.FileName or doc.Name),tostr(id(doc)),tostr(watcher.get_revision(doc))]+sorted([o.Name for o in objectslist]))
+
+
+def export_ifc(objectslist,quiet=False):
+
+    """Saves an IFC file with the given objects to the scratch space. If the same objects were already
+    exported and the document hasn't changed since, the previous file is reused. Nothing is printed if
+    quiet is True. Returns the file path."""
+
+    scratch = get_scratch_space()
+    key = get_export_key(objectslist)
+    if key:
+        tf = scratch.get_model_file(key)
+        if tf:
+            if not quiet:
+                print("Reusing IFC file at",tf)
+            return tf
+    tf = scratch.new_file(".ifc")
+    if not quiet:
+        print("Saving temporary IFC file at",tf)
+    import importIFC
+    # the exporter may touch objects, that doesn't change the model
+    watcher = get_document_watcher()
+    watcher.paused = True
+    try:
+        importIFC.export(objectslist,tf)
+    finally:
+        watcher.paused = False
+    if key:
+        tf = scratch.store_model_file(key,tf)
+    else:
+        scratch.cleanup(keep=[tf])
+    return tf
+
+
+def prepare_shape(obj):
+
+    """Triangulates the shape of the given object ahead of an export. OCC keeps the triangulation with
+    the shape, and the IFC exporter reuses it for any triangulation that is not finer. Returns nothing"""
+
+    shape = getattr(obj,"Shape",None)
+    if shape is None:
+        return
+    try:
+        if not shape.isNull():
+            shape.tessellate(0.1)
+    except:
+        if DEBUG:
+            print("Error: unable to triangulate",obj.Name)
+
+
+class speculative_exporter:
+
+    """Exports objects of the active document once it has stayed unchanged for speculative_delay seconds,
+    so the next run finds a ready export (see export_ifc()). FreeCAD documents, view providers and the IFC
+    exporter can only be used from the GUI thread, so the work is cut in slices run from a Qt timer, leaving
+    the interface responsive in between: the shapes are first triangulated a few objects at a time (see
+    prepare_shape()), then the exporter writes the file in a last, shorter slice. Any change to the
+    document cancels the remaining slices and restarts the countdown."""
+
+    slice_time = 0.05 # seconds of work per slice
+
+    def __init__(self,get_objects):
+
+        self.get_objects = get_objects # a function returning the objects to export
+        self.enabled = False
+        self.timer = QtCore.QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.step)
+        self.objects = None # the objects being exported, if an export is in progress
+        self.pending = [] # the objects whose shape is not prepared yet
+        self.key = None # the export key of the objects when the export started
+        self.watcher = get_document_watcher()
+        self.watcher.listeners.append(self.on_change)
+
+    def start(self):
+
+        "Enables background export and starts the countdown. Returns nothing"
+
+        self.enabled = True
+        self.restart()
+
+    def restart(self):
+
+        "Cancels the export in progress, if any, and starts the countdown again. Returns nothing"
+
+        self.objects = None
+        self.pending = []
+        self.timer.start(int(float(get_config_value("speculative_delay"))*1000))
+
+    def stop(self):
+
+        "Disables background export and cancels the pending one. Returns nothing"
+
+        self.enabled = False
+        self.timer.stop()
+        self.objects = None
+        self.pending = []
+
+    def close(self):
+
+        "Stops and detaches this exporter from the document watcher. Returns nothing"
+
+        self.stop()
+        if self.on_change in self.watcher.listeners:
+            self.watcher.listeners.remove(self.on_change)
+
+    def on_change(self,doc):
+
+        "Called by the document watcher. Restarts the countdown if the active document changed. Returns nothing"
+
+        if self.enabled and (doc == FreeCAD.ActiveDocument):
+            self.restart()
+
+    def step(self):
+
+        "Runs the next slice of the background export, and schedules the one after it. Returns nothing"
+
+        if not (self.enabled and FreeCAD.ActiveDocument):
+            self.objects = None
+            return
+        if self.objects is None:
+            objectslist = self.get_objects()
+            key = get_export_key(objectslist)
+            if (not key) or get_scratch_space().get_model_file(key):
+                # nothing to export, or already exported in this state
+                return
+            self.objects = objectslist
+            self.pending = list(objectslist)
+            self.key = key
+        elif self.pending:
+            end = time.time() + self.slice_time
+            while self.pending and (time.time() < end):
+                prepare_shape(self.pending.pop())
+        else:
+            objectslist = self.objects
+            self.objects = None
+            if get_export_key(objectslist) == self.key:
+                if DEBUG:
+                    print("Exporting",len(objectslist),"objects in the background")
+                try:
+                    export_ifc(objectslist,quiet=True)
+                except:
+                    if DEBUG:
+                        print("Error: background export failed")
+            return
+        # let Qt process pending events before the next slice
+        self.timer.start(0)
+
+
+def get_object_guid(obj):
+
+    "Returns the IFC GUID of the given FreeCAD object, or None"
+
+    if hasattr(obj,"IfcData"): # FreeCAD 0.19
+        if "IfcUID" in obj.IfcData.keys():
+            return str(obj.IfcData["IfcUID"])
+    elif hasattr(obj,"IfcAttributes"): # FreeCAD 0.18
+        if "IfcUID" in obj.IfcAttributes.keys():
+            return str(obj.IfcAttributes["IfcUID"])
+    return None
+
+
+def get_document_guids(doc):
+
+    "Returns a dict {IFC GUID: [objects]} for all the objects of the given FreeCAD document that have a GUID"
+
+    guids = {}
+    for obj in doc.Objects:
+        guid = get_object_guid(obj)
+        if guid:
+            guids.setdefault(guid,[]).append(obj)
+    return guids
+
+
+class result_overlay:
+
+    """Colors the objects of a FreeCAD document, and remembers their original colors so they can be
+    restored. Colors are applied in one batch with scene graph notifications disabled, so the 3D view
+    is redrawn once for the whole batch instead of once per object."""
+
+    def __init__(self):
+
+        self.originals = {} # (document name, object name): (ShapeColor, DiffuseColor)
+
+    def batch(self,func,items):
+
+        "Calls func(viewobject,value) for each (object,value) of the given items with scene notifications disabled. Returns nothing"
+
+        root = None
+        try:
+            root = FreeCADGui.ActiveDocument.ActiveView.getSceneGraph()
+            root.enableNotify(False)
+        except:
+            root = None
+        try:
+            for obj, value in items:
+                if obj.ViewObject and hasattr(obj.ViewObject,"ShapeColor"):
+                    func(obj.ViewObject,value)
+        finally:
+            if root is not None:
+                root.enableNotify(True)
+                root.touch()
+
+    def apply(self,colors):
+
+        "Applies the given dict {object: (r,g,b)} of colors, storing the original colors first. Returns nothing"
+
+        def set_color(vobj,color):
+            key = (vobj.Object.Document.Name,vobj.Object.Name)
+            if key not in self.originals:
+                self.originals[key] = (vobj.ShapeColor,getattr(vobj,"DiffuseColor",None))
+            if vobj.ShapeColor[:3] != color:
+                vobj.ShapeColor = color
+
+        self.batch(set_color,colors.items())
+
+    def restore(self):
+
+        "Restores all the original colors in one pass. Returns nothing"
+
+        items = []
+        for (docname, objname), original in self.originals.items():
+            try:
+                obj = FreeCAD.getDocument(docname).getObject(objname)
+            except NameError:
+                obj = None
+            if obj:
+                items.append((obj,original))
+
+        def set_original(vobj,original):
+            vobj.ShapeColor = original[0]
+            if original[1] and (len(original[1]) > 1):
+                vobj.DiffuseColor = original[1]
+
+        self.batch(set_original,items)
+        self.originals = {}
+
+
+# Qt classes can only be defined when the FreeCAD GUI is up
+if ("FreeCAD" in globals()) and FreeCAD.GuiUp:
+
+    class result_table_model(QtCore.QAbstractTableModel):
+
+        def __init__(self,table):
+
+            QtCore.QAbstractTableModel.__init__(self)
+            self.table = table
+            self.order = list(range(len(table))) # the rows in sorted order
+            self.view = self.order # the sorted rows that pass the filter
+            self.filter = ""
+
+        def rowCount(self,parent=QtCore.QModelIndex()):
+
+            return 0 if parent.isValid() else len(self.view)
+
+        def columnCount(self,parent=QtCore.QModelIndex()):
+
+            return 0 if parent.isValid() else len(self.table.columns)
+
+        def data(self,index,role=QtCore.Qt.DisplayRole):
+
+            if index.isValid():
+                if role == QtCore.Qt.DisplayRole:
+                    value = self.table.get_value(self.view[index.row()],index.column())
+                    return "" if value is None else tostr(value)
+                elif (role == QtCore.Qt.TextAlignmentRole) and self.table.is_numeric(index.column()):
+                    return int(QtCore.Qt.AlignRight|QtCore.Qt.AlignVCenter)
+            return None
+
+        def headerData(self,section,orientation,role=QtCore.Qt.DisplayRole):
+
+            if role == QtCore.Qt.DisplayRole:
+                if orientation == QtCore.Qt.Horizontal:
+                    key = tostr(self.table.columns[section])
+                    if DECAMELIZE:
+                        key = ''.join(map(lambda x: x if x.islower() else " "+x, key)).strip()
+                    return key
+                return tostr(section+1)
+            return None
+
+        def sort(self,column,order=QtCore.Qt.AscendingOrder):
+
+            self.layoutAboutToBeChanged.emit()
+            self.order = self.table.sort_order(column,order == QtCore.Qt.DescendingOrder)
+            self.view = self.table.filter_rows(self.filter,self.order)
+            self.layoutChanged.emit()
+
+        def set_filter(self,text):
+
+            self.beginResetModel()
+            if self.filter and text.lower().startswith(self.filter.lower()):
+                # the new filter is narrower, only filter the rows shown now
+                self.view = self.table.filter_rows(text,self.view)
+            else:
+                self.view = self.table.filter_rows(text,self.order)
+            self.filter = text
+            self.endResetModel()
+
+
+def get_table_model(table):
+
+    "Returns a Qt table model showing the given result_table. Only the rows shown on screen are ever read"
+
+    return result_table_model(table)
+
+
+class bimbots_panel:
+
+    """This is the interface panel implementation of bimbots.ui. It is meant to run inside FreeCAD.
+    It is launched by the launch_ui() function"""
+
+    def __init__(self):
+
+        # this is to be able to cancel running progress
+        self.running = True
+
+        # the search index of the current json results, and the tree items of its nodes
+        self.result_index = None
+        self.result_items = []
+        self.visible_nodes = None # None means all nodes are visible
+
+        # the tables found in the current json results, as a list of (path,result_table)
+        self.result_tables = []
+
+        # a (document name, {IfcUID: [objects]}) tuple for the active document, built when needed
+        self.document_guids = None
+
+        # the results currently shown, and the colors applied to the model from them
+        self.results = None
+        self.overlay = result_overlay()
+
+        # locate and load available translations, once per session
+        if not ui_cache["translations"]:
+            FreeCADGui.addLanguagePath(os.path.join(os.path.dirname(__file__),"translations"))
+            ui_cache["translations"] = True
+
+        # create the form from the ui file
+        self.form = get_form()
+
+        # start counting document changes, so unchanged models are not exported twice
+        get_document_watcher()
+
+        # the (job id, service_record) of the job started by on_run, and a timer to follow
+        # it and the queue, that also shows the jobs resumed from a previous session
+        self.job = None
+        self.job_timer = QtCore.QTimer()
+        self.job_timer.timeout.connect(self.on_job_timer)
+        self.job_timer.start(500)
+
+        # the scan running in a worker thread, as a dict filled by scan_worker, and a timer to follow it
+        self.scan = None
+        self.scan_timer = QtCore.QTimer()
+        self.scan_timer.timeout.connect(self.on_scan_timer)
+
+        # exports the model in the background when the document is idle, if enabled
+        self.speculative = speculative_exporter(self.get_speculative_objects)
+
+        # set the icon
+        self.form.setWindowIcon(get_icon("BIM-Bots-validationchecker.png"))
+        # hide the logo for now TODO : Do something better here... (BIM-Bots-header.png, scaled to w*0.2578)
+        # it is not loaded at all while hidden
+        self.form.labelLogo.setText("")
+        self.form.labelLogo.hide()
+
+        # hide the collapsible parts
+        self.form.groupProgress.hide()
+        self.form.groupRescan.hide()
+        self.form.groupAddService.hide()
+        self.form.groupAuthenticate.hide()
+        self.form.groupResults.hide()
+        self.form.labelQueue.hide()
+
+        # restore default settings
+        self.get_defaults()
+
+        # connect buttons
+        self.form.buttonRescan.clicked.connect(self.form.groupRescan.show)
+        self.form.buttonDoRescan.clicked.connect(self.form.groupRescan.hide)
+        self.form.buttonDoRescan.clicked.connect(self.on_scan)
+        self.form.buttonCancelRescan.clicked.connect(self.form.groupRescan.hide)
+        self.form.buttonAddService.clicked.connect(self.form.groupAddService.show)
+        self.form.buttonRemoveService.clicked.connect(self.on_remove_service)
+        self.form.buttonSaveService.clicked.connect(self.on_add_service)
+        self.form.buttonCancelService.clicked.connect(self.form.groupAddService.hide)
+        self.form.buttonAuthenticate.clicked.connect(self.form.groupAuthenticate.show)
+        self.form.buttonAuthenticate.clicked.connect(self.on_authenticate)
+        self.form.buttonSaveAuthenticate.clicked.connect(self.on_save_authenticate)
+        self.form.buttonCancelAuthenticate.clicked.connect(self.form.groupAuthenticate.hide)
+        self.form.buttonRun.clicked.connect(self.on_run)
+        self.form.buttonFindings.clicked.connect(self.on_findings)
+        self.form.buttonColorize.clicked.connect(self.on_colorize)
+        self.form.buttonRestoreColors.clicked.connect(self.on_restore_colors)
+        self.form.buttonCancelProgress.clicked.connect(self.on_cancel)
+        self.form.buttonCloseResults.clicked.connect(self.form.groupServices.show)
+        self.form.buttonCloseResults.clicked.connect(self.form.groupRun.show)
+        self.form.buttonCloseResults.clicked.connect(self.form.groupResults.hide)
+
+        # fields validation
+        self.form.lineEditServiceName.textChanged.connect(self.validate_fields)
+        self.form.lineEditServiceUrl.textChanged.connect(self.validate_fields)
+        self.form.lineEditAuthenticateUrl.textChanged.connect(self.validate_fields)
+        self.form.lineEditAuthenticateToken.textChanged.connect(self.validate_fields)
+
+        # connect services list
+        self.form.servicesList.currentItemChanged.connect(self.on_list_click)
+        self.form.scopeList.currentItemChanged.connect(self.on_list_click)
+
+        # connect widgets that should remember their setting
+        self.form.checkAutoDiscover.stateChanged.connect(self.save_defaults)
+        self.form.checkShowUnreachable.stateChanged.connect(self.save_defaults)
+        self.form.checkSpeculative.stateChanged.connect(self.save_defaults)
+        self.form.checkSpeculative.stateChanged.connect(self.on_speculative)
+        self.on_speculative()
+
+        # connect clickable links
+        self.form.treeResults.itemDoubleClicked.connect(self.on_click_results)
+        self.form.lineEditSearch.textChanged.connect(self.on_search)
+        self.form.lineEditSearch.returnPressed.connect(self.on_search_select)
+        self.form.comboTables.currentIndexChanged.connect(self.on_table_changed)
+        self.form.comboGroupBy.currentIndexChanged.connect(self.on_group_changed)
+        self.form.tableResults.doubleClicked.connect(self.on_click_table)
+        self.form.labelHelp.linkActivated.connect(self.on_click_help)
+
+        # show the services known from the last session at once, then
+        # perform initial scan after the UI has been fully drawn
+        if registry.provider_order or registry.load_cache():
+            self.update_services_list()
+        QtCore.QTimer.singleShot(0,self.on_scan)
+
+        # remove test items if needed
+        if not DEBUG:
+            self.form.scopeList.takeItem(5) # Test output only
+            self.form.scopeList.takeItem(4) # Test payload
+            self.form.scopeList.takeItem(3) # External IFC file
+
+    def getStandardButtons(self):
+
+        "The list of buttons to show above the task panel. Returns a Close button only."
+
+        return int(QtGui.QDialogButtonBox.Close)
+
+    def needsFullSpace(self):
+
+        "Notifies FreeCAD that this panel needs max height. Returns True"
+
+        return True
+
+    def reject(self):
+
+        """Called when the "Close" button of the task dialog is pressed, closes the panel. Returns nothing"""
+
+        self.on_restore_colors()
+        self.speculative.close()
+        self.job_timer.stop()
+        self.scan_timer.stop()
+        self.running = False
+        FreeCADGui.Control.closeDialog()
+        if FreeCAD.ActiveDocument:
+            FreeCAD.ActiveDocument.recompute()
+
+    def on_scan(self):
+
+        """Starts scanning for providers and services in a worker thread, so the interface stays responsive.
+        The Available Services list is updated when the scan is finished (see on_scan_timer). Returns nothing"""
+
+        import threading
+        if self.scan and self.scan['thread'].is_alive():
+            return
+
+        # setup the progress bar
+        self.running = True
+        self.form.groupProgress.show()
+        self.form.progressBar.setFormat(translate("BIMBots","Getting services"))
+        self.form.progressBar.setValue(0)
+
+        # query services
+        self.scan = {"autodiscover":self.form.checkAutoDiscover.isChecked(),"providers":None,"services":{}}
+        self.scan['thread'] = threading.Thread(target=self.scan_worker,args=(self.scan,))
+        self.scan['thread'].daemon = True
+        self.scan['thread'].start()
+        self.scan_timer.start(100)
+
+    def scan_worker(self,scan):
+
+        "Fetches the providers and their services into the given scan dict. Runs in a worker thread and doesn't touch the interface. Returns nothing"
+
+        scan['providers'] = get_service_providers(autodiscover=scan['autodiscover'])
+        for data in scan['providers']:
+            if not self.running:
+                break
+            scan['services'][data['listUrl']] = get_services(data['listUrl'])
+
+    def on_scan_timer(self):
+
+        "Shows the progress of the scan started by on_scan, and updates the registry and the Available Services list when it is finished. Returns nothing"
+
+        scan = self.scan
+        if scan['providers']:
+            self.form.progressBar.setValue(int(100*(len(scan['services'])/float(len(scan['providers'])))))
+        if scan['thread'].is_alive():
+            return
+        self.scan_timer.stop()
+        if scan['providers'] is not None:
+            registry.scan_providers(providers=scan['providers'])
+            # providers not reached before the scan was cancelled keep their known services
+            for list_url, services in scan['services'].items():
+                registry.scan_services(list_url,services)
+            self.update_services_list()
+            registry.save_cache()
+
+        # clean the progress bar
+        self.running = False
+        self.form.groupProgress.hide()
+        self.form.groupRescan.hide()
+
+    def update_services_list(self):
+
+        "Rebuilds the Available Services list from the registry, keeping the current selection. Returns nothing"
+
+        current = self.get_selected_service() or self.get_selected_provider()
+        current = current.key if isinstance(current,service_record) else (current.list_url if current else None)
+        self.form.servicesList.clear()
+        # services offered by several providers are listed under each of them, the best one is picked when a run starts
+        mirrors = {}
+        for list_url in registry.provider_order:
+            for service in registry.get_services(list_url):
+                mirrors.setdefault(service.identity,[]).append(service)
+        for list_url in registry.provider_order:
+            provider = registry.get_provider(list_url)
+            services = registry.get_services(list_url)
+            if (provider.reachable == False) and not self.form.checkShowUnreachable.isChecked():
+                continue
+            top = QtGui.QTreeWidgetItem(self.form.servicesList)
+            top.setText(0,provider.name)
+            top.setIcon(0,get_icon("Tango-Computer.svg"))
+            # store the provider key
+            top.setData(0,QtCore.Qt.UserRole,list_url)
+            top.setToolTip(0,provider.description or provider.name)
+            if provider.custom:
+                top.setToolTip(0,top.toolTip(0)+" ("+translate("BIMBots","saved")+")")
+            else:
+                top.setToolTip(0,top.toolTip(0)+" ("+translate("BIMBots","autodiscovered")+")")
+            if current == list_url:
+                self.form.servicesList.setCurrentItem(top)
+            for service in services:
+                # services descriptions might contain a more accurate server name
+                if service.provider and (service.provider != top.text(0)):
+                    top.setText(0,service.provider)
+                child = QtGui.QTreeWidgetItem(top)
+                child.setText(0,service.name)
+                # store the service key
+                child.setData(0,QtCore.Qt.UserRole,list(service.key))
+                # construct tooltip with different pieces of data
+                tooltip = service.description or ""
+                if service.inputs:
+                    tooltip += "\n"+"inputs: "+",".join(service.inputs)
+                if service.outputs:
+                    tooltip += "\n"+"outputs: "+",".join(service.outputs)
+                others = [m for m in mirrors[service.identity] if m is not service]
+                if others:
+                    tooltip += "\n"+translate("BIMBots","Also available from")+": "+", ".join([registry.get_provider(m.provider_url).name for m in others])
+                if service.authenticated:
+                    child.setIcon(0,get_icon(":/icons/button_valid.svg")) # FreeCAD builtin icon
+                    tooltip += "\n"+translate("BIMBots","Authenticated")
+                child.setToolTip(0,tooltip)
+                if current == service.key:
+                    self.form.servicesList.setCurrentItem(child)
+            if services:
+                top.setExpanded(True)
+            elif provider.reachable == False:
+                # show provider as disabled: remove Enabled from flags
+                # This doesn't work well as it becomes unselectable and therefore not removable
+                # top.setFlags(top.flags() & ~QtCore.Qt.ItemIsEnabled)
+                # instead, paint it with the disabled color and show a daunting icon
+                top.setIcon(0,get_icon(":/icons/button_invalid.svg"))
+                palette = QtGui.QApplication.palette()
+                top.setForeground(0,palette.brush(palette.Disabled,palette.Text))
+                top.setToolTip(0,top.toolTip(0)+" - "+translate("BIMBots","Unreachable"))
+
+    def get_selected_service(self):
+
+        "Returns the service_record of the selected item of the Available Services list, or None"
+
+        serviceitem = self.form.servicesList.currentItem()
+        if serviceitem and serviceitem.parent():
+            return registry.get_service(serviceitem.data(0,QtCore.Qt.UserRole))
+        return None
+
+    def get_selected_provider(self):
+
+        "Returns the provider_record of the selected item of the Available Services list, or of the provider of the selected service, or None"
+
+        serviceitem = self.form.servicesList.currentItem()
+        if serviceitem:
+            if serviceitem.parent():
+                serviceitem = serviceitem.parent()
+            return registry.get_provider(serviceitem.data(0,QtCore.Qt.UserRole))
+        return None
+
+    def on_list_click(self,arg1=None,arg2=None):
+
+        "Checks which items are selected and what options should be enabled. Args not used. Returns nothing"
+
+        # start by disabling everything
+        self.form.buttonRemoveService.setEnabled(False)
+        self.form.buttonAuthenticate.setEnabled(False)
+        self.form.buttonRun.setEnabled(False)
+        serviceitem = self.form.servicesList.currentItem()
+        scopeitem = self.form.scopeList.currentItem()
+        if scopeitem:
+            if scopeitem.text() == translate("BIMBots","Test output only"):
+                # this is a test item that doesn't send data toany service
+                self.form.buttonRun.setEnabled(True)
+        if serviceitem:
+            if serviceitem.parent():
+                # this is a service
+                service = self.get_selected_service()
+                if service:
+                    self.form.buttonAuthenticate.setEnabled(True)
+                    if service.authenticated and scopeitem:
+                        self.form.buttonRun.setEnabled(True)
+            else:
+                # this is a provider
+                provider = self.get_selected_provider()
+                if provider and provider.custom:
+                    self.form.buttonRemoveService.setEnabled(True)
+
+    def on_click_help(self,arg=None):
+
+        "Opens a browser to show the BIMbots help page. Arg not used. Returns nothing"
+
+        url = "https://github.com/opensourceBIM/BIMbots-FreeCAD/blob/master/doc/ui-documentation.md"
+        err = "Error: Unable to launch web browser. Please paste the following URL in your web browser: " + url
+        try:
+            import webbrowser
+        except:
+            print(err)
+        else:
+            res = webbrowser.open(url)
+            if not res:
+                print(err)
+
+    def validate_fields(self,arg=None):
+
+        "Validates the editable fields, turn buttons on/off as needed. Arg not used. Returns nothing"
+
+        # disable everything first
+        self.form.buttonSaveService.setEnabled(False)
+        self.form.buttonSaveAuthenticate.setEnabled(False)
+
+        if self.form.lineEditServiceName.text() and self.form.lineEditServiceUrl.text():
+            self.form.buttonSaveService.setEnabled(True)
+
+        if self.form.lineEditAuthenticateUrl.text() and self.form.lineEditAuthenticateToken.text():
+            self.form.buttonSaveAuthenticate.setEnabled(True)
+
+    def on_add_service(self):
+
+        "Adds a custom service provider and its services and updates the Available Services list. Returns nothing"
+
+        name = self.form.lineEditServiceName.text()
+        url = self.form.lineEditServiceUrl.text()
+        if name and url:
+            save_custom_provider(name,url)
+            self.form.groupAddService.hide()
+            QtCore.QTimer.singleShot(0,self.on_scan)
+
+    def on_remove_service(self):
+
+        "Removes a custom service provider from the config. Returns nothing"
+
+        serviceitem = self.form.servicesList.currentItem()
+        if serviceitem:
+            if not serviceitem.parent():
+                # this is a provider
+                name = serviceitem.text(0)
+                provider = self.get_selected_provider()
+                if provider and provider.custom:
+                    reply = QtGui.QMessageBox.question(None,
+                                                       translate("BIMBots","Removal warning"),
+                                                       translate("BIMBots","Remove provider")+" \""+name+"\"? "+translate("BIMBots","This cannot be undone."),
+                                                       QtGui.QMessageBox.Yes | QtGui.QMessageBox.No,
+                                                       QtGui.QMessageBox.No)
+                    if reply == QtGui.QMessageBox.Yes:
+                        delete_custom_provider(provider.list_url)
+                        QtCore.QTimer.singleShot(0,self.on_scan)
+
+    def on_authenticate(self):
+
+        "Opens a browser window to authenticate. Returns nothing"
+
+        self.form.groupAuthenticate.show()
+        self.form.lineEditAuthenticateToken.clear()
+        self.form.lineEditAuthenticateUrl.clear()
+        service = self.get_selected_service()
+        if service:
+            if "registerUrl" in service.oauth:
+                step1 = authenticate_step_1(service.oauth['registerUrl'])
+                if step1:
+                    auth_url = service.oauth['authorizationUrl']
+                    client_id = step1['client_id']
+                    step2 = authenticate_step_2(auth_url,client_id,service.name)
+                    if step2 == True:
+                        return
+                    msg = translate("BIMBots","Unable to open a web browser. Please paste the following URL in your web browser")+": " + step2
+                    QtGui.QMessageBox.information(None,"Error",msg)
+        print("Error: Unable to start authentication!")
+
+    def on_save_authenticate(self):
+
+        "Authenticates with the selected service and updates the Available Services list. Returns nothing"
+
+        service_url = self.form.lineEditAuthenticateUrl.text()
+        token = self.form.lineEditAuthenticateToken.text()
+        if service_url and token:
+            service = self.get_selected_service()
+            if service:
+                save_authentication(service.provider_url,service.id,service.name,service_url,token)
+                self.form.groupAuthenticate.hide()
+                # no need to rescan, only the authentication state changed
+                registry.refresh_authentication()
+                self.update_services_list()
+                self.on_list_click()
+                return
+        print("Error: Unable to register authentication!")
+
+    def on_run(self):
+
+        "Runs the selected service: queues a job and waits for its results. Returns nothing"
+
+        results = None
+        service = self.get_selected_service()
+        scopeitem = self.form.scopeList.currentItem()
+        if scopeitem:
+            if scopeitem.text() == "Test output only":
+                # Test item - don't run any service, just show dummy results from file
+                payload_response = os.path.join(os.path.dirname(__file__),"testfiles","test payload response.json")
+                if os.path.exists(payload_response):
+                    with open(payload_response) as json_file:
+                        results = json.load(json_file)
+            elif service and service.authenticated:
+                # we have scope and authenticated service: let's run!
+                self.running = True
+                # setup the progress bar
+                self.form.groupProgress.show()
+                self.form.progressBar.setFormat(translate("BIMBots","Preparing"))
+                self.form.progressBar.setValue(25)
+                file_path = None
+                if scopeitem.text() == translate("BIMBots","Test payload"):
+                    # no need to check for current document if running a test payload
+                    file_path = os.path.join(os.path.dirname(__file__),"testfiles","test payload.ifc")
+                elif scopeitem.text() == translate("BIMBots","Choose IFC file"):
+                    ret = QtGui.QFileDialog.getOpenFileName(None, translate("BIMBots","Choose an existing IFC file"), None, translate("BIMBots","IFC files (*.ifc)"))
+                    if ret:
+                        file_path = ret[0]
+                else:
+                    if FreeCAD.ActiveDocument:
+                        self.form.progressBar.setFormat(translate("BIMBots","Saving IFC file"))
+                        self.form.progressBar.setValue(25)
+                        objectslist = self.get_scope_objects(scopeitem.text())
+                        if objectslist:
+                            file_path = self.save_ifc(objectslist)
+                if file_path and self.running:
+                    self.form.progressBar.setFormat(translate("BIMBots","Sending data"))
+                    self.form.progressBar.setValue(75)
+                    self.job = (get_job_queue().submit(service.provider_url,service.id,file_path),service)
+                    self.job_timer.start(500)
+                    return
+
+        # show the results
+        self.form.groupProgress.hide()
+        self.show_results(results,service)
+
+    def on_job_timer(self):
+
+        "Checks the state of the job queue and of the job started by on_run. Shows its results when finished. Returns nothing"
+
+        status = get_job_status()
+        running = status.get("running",0)
+        pending = status.get("pending",0)
+        if running or pending:
+            self.form.labelQueue.setText(translate("BIMBots","Jobs")+": "+str(running)+" "+translate("BIMBots","running")+", "+str(pending)+" "+translate("BIMBots","pending"))
+            self.form.labelQueue.show()
+        else:
+            self.form.labelQueue.hide()
+        if not self.job:
+            if not (running or pending):
+                self.job_timer.stop()
+            return
+        job_id, service = self.job
+        job = get_job_queue().get_job(job_id)
+        if (not job) or (job['state'] in ["pending","running"]):
+            self.form.progressBar.setFormat(translate("BIMBots","Waiting in queue") if job and (job['state'] == "pending") else translate("BIMBots","Sending data"))
+            return
+        self.job = None
+        self.form.groupProgress.hide()
+        if job['state'] == "cancelled":
+            return
+        self.show_results(get_job_queue().get_results(job),service)
+
+    def show_results(self,results,service=None):
+
+        "Shows the given results (a dict, or text or BCF data) of the given service_record in the results area. Shows an error if there are no results. Returns nothing"
+
+        self.document_guids = None
+        self.results = results
+        if results:
+            self.form.groupServices.hide()
+            self.form.groupRun.hide()
+            self.form.groupResults.show()
+            if isinstance(results,dict):
+                # json results
+                self.form.textResults.hide()
+                self.form.treeResults.show()
+                self.form.lineEditSearch.show()
+                self.result_index = None
+                self.form.lineEditSearch.clear()
+                self.form.treeResults.clear()
+                self.result_items = []
+                self.fill_item(self.form.treeResults.invisibleRootItem(), results)
+                self.result_index = result_index(results)
+                self.visible_nodes = None
+                self.result_tables = find_tables(results)
+                self.form.comboTables.blockSignals(True)
+                self.form.comboTables.clear()
+                self.form.comboTables.addItem(translate("BIMBots","Tree view"))
+                for path, table in self.result_tables:
+                    self.form.comboTables.addItem(path.strip("/")+" ("+str(len(table))+")")
+                self.form.comboTables.blockSignals(False)
+                self.form.comboTables.setVisible(bool(self.result_tables))
+                self.on_table_changed(0)
+            else:
+                # text results
+                if service:
+                    # detect if this is a BCF file
+                    if service.outputs_bcf():
+                        # BCF results
+                        bcf_path = get_scratch_space().write(results,".bcf.zip")
+                        results = translate("BIMBots","BCF results saved as:")+" " + bcf_path + ". "+translate("BIMBots","BCF viewing is not yet implemented.")
+                if DEBUG:
+                    print(translate("BIMBots","Results")+":",results)
+                self.form.textResults.show()
+                self.form.treeResults.hide()
+                self.form.lineEditSearch.hide()
+                self.form.comboTables.hide()
+                self.form.comboGroupBy.hide()
+                self.form.tableResults.hide()
+                self.form.textResults.clear()
+                self.form.textResults.setPlainText(results)
+        else:
+            FreeCAD.Console.PrintError(translate("BIMBots","Error: No results obtained")+"\n")
+            QtGui.QMessageBox.critical(None,translate("BIMBots","Empty response"),
+                                       translate("BIMBots","The server didn't send a valid response. There can be many reasons to this, but the most likely is that the IFC file generated from your model wasn't accepted by the server. Try working with only a couple of selected objects first, to see if the service is responding correctly."))
+
+    def fill_item(self, item, value, link=False):
+
+        "fills a QtreeWidget or QtreeWidgetItem with a dict, list or text/number value. If link is true, paints in link color. Returns nothing"
+
+        # adapted from https://stackoverflow.com/questions/21805047/qtreewidget-to-mirror-python-dictionary
+        item.setExpanded(True)
+        if isinstance(value,dict):
+            for key, val in sorted(value.items()):
+                child = QtGui.QTreeWidgetItem()
+                item.addChild(child)
+                self.result_items.append(child)
+                child.setExpanded(True)
+                if tostr(key).lower().startswith("ifc"):
+                    palette = QtGui.QApplication.palette()
+                    child.setForeground(0,palette.brush(palette.Active,palette.Link))
+                    child.setToolTip(0,"typeLink:"+tostr(key))
+                if DECAMELIZE:
+                    key = ''.join(map(lambda x: x if x.islower() else " "+x, key)).strip()
+                child.setText(0, tostr(key))
+                childlink = link
+                if (tostr(key).lower() == "guid"):
+                    childlink = "uuidLink:"
+                elif ((tostr(key).lower() == "name") and (tostr(val) != tostr(val).upper())):
+                    childlink = "nameLink:"
+                elif ((tostr(key).lower() == "type") and (tostr(val).lower().startswith("ifc"))):
+                    childlink = "typeLink:"
+                self.fill_item(child, val, childlink)
+        elif isinstance(value,list):
+            for index,val in enumerate(value):
+                child = QtGui.QTreeWidgetItem()
                 item.addChild(child)
+                self.result_items.append(child)
                 child.setExpanded(True)
                 child.setText(0, tostr(index))
                 self.fill_item(child, val)
@@ -957,56 +4244,243 @@ class bimbots_panel:
 
         "Selects associated objects in document when an item is clicked. Returns nothing"
 
-        tosel = []
         tooltip = item.toolTip(column)
+        if tooltip:
+            if "Link:" in tooltip:
+                tooltip = tooltip.split("Link:")
+                if tooltip[0] in ["uuid","name","type"]:
+                    self.select_objects(self.find_objects(**{tooltip[0]+"s":[tooltip[1]]}))
+
+    def find_objects(self,uuids=(),names=(),types=()):
+
+        "Returns the objects of the active document that have one of the given IFC GUIDs, labels or IFC types (IfcWall or Wall). Returns a list"
+
+        found = []
         if FreeCAD.ActiveDocument:
-            if tooltip:
-                if "Link:" in tooltip:
-                    tooltip = tooltip.split("Link:")
-                    if tooltip[0] == "uuid":
-                        for obj in FreeCAD.ActiveDocument.Objects:
-                            if hasattr(obj,"IfcData"): # FreeCAD 0.19
-                                if "IfcUID" in obj.IfcData.keys():
-                                    if str(obj.IfcData["IfcUID"]) == tooltip[1]:
-                                        tosel.append(obj)
-                            elif hasattr(obj,"IfcAttributes"): # FreeCAD 0.18
-                                if "IfcUID" in obj.IfcAttributes.keys():
-                                    if str(obj.IfcAttributes["IfcUID"]) == tooltip[1]:
-                                        tosel.append(obj)
-                    elif tooltip[0] == "name":
-                        for obj in FreeCAD.ActiveDocument.Objects:
-                            if obj.Label == tooltip[1]:
-                                tosel.append(obj)
-                    elif tooltip[0] == "type":
-                        if tooltip[1].lower().startswith("ifc"):
-                            ifctype = tooltip[1][3:]
-                            for obj in FreeCAD.ActiveDocument.Objects:
-                                if hasattr(obj,"IfcType"): # FreeCAD 0.19
-                                    if obj.IfcType.lower().replace(" ","") == ifctype.lower():
-                                        tosel.append(obj)
-                                elif hasattr(obj,"IfcRole"): # FreeCAD 0.18
-                                    if obj.IfcRole.lower().replace(" ","") == ifctype.lower():
-                                        tosel.append(obj)
-        if tosel:
+            uuids = set(uuids)
+            names = set(names)
+            types = set([t[3:].lower() if t.lower().startswith("ifc") else t.lower() for t in types])
+            if uuids:
+                if (self.document_guids is None) or (self.document_guids[0] != FreeCAD.ActiveDocument.Name):
+                    self.document_guids = (FreeCAD.ActiveDocument.Name,get_document_guids(FreeCAD.ActiveDocument))
+                for uuid in uuids:
+                    found.extend(self.document_guids[1].get(uuid,[]))
+            if not (names or types):
+                return found
+            for obj in FreeCAD.ActiveDocument.Objects:
+                if names and (obj.Label in names):
+                    found.append(obj)
+                    continue
+                if types:
+                    if hasattr(obj,"IfcType"): # FreeCAD 0.19
+                        if obj.IfcType.lower().replace(" ","") in types:
+                            found.append(obj)
+                    elif hasattr(obj,"IfcRole"): # FreeCAD 0.18
+                        if obj.IfcRole.lower().replace(" ","") in types:
+                            found.append(obj)
+        return found
+
+    def on_findings(self):
+
+        "Shows the findings of all services about the selected objects, from the latest model they were found in. Returns nothing"
+
+        guids = [get_object_guid(obj) for obj in FreeCADGui.Selection.getSelection()]
+        guids = [guid for guid in guids if guid]
+        index = None
+        for guid in guids:
+            model = get_latest_model(guid)
+            if model:
+                index = guid_index(model)
+                break
+        if index and index.get_report(guids):
+            self.show_results(index.get_report(guids))
+        else:
+            QtGui.QMessageBox.information(None,translate("BIMBots","No findings"),
+                                          translate("BIMBots","No service has found anything about the selected objects yet. Run a service on a model containing them first."))
+
+    def on_colorize(self):
+
+        "Colors the objects of the active document according to the current results. Returns nothing"
+
+        if not (FreeCAD.ActiveDocument and self.results):
+            return
+        scores = get_guid_scores(self.results)
+        if not scores:
+            FreeCAD.Console.PrintWarning(translate("BIMBots","These results don't reference any object")+"\n")
+            return
+        maximum = max(scores.values())
+        guids = get_document_guids(FreeCAD.ActiveDocument)
+        self.document_guids = (FreeCAD.ActiveDocument.Name,guids)
+        colors = {}
+        for guid, objects in guids.items():
+            color = get_score_color(scores.get(guid,0),maximum)
+            for obj in objects:
+                colors[obj] = color
+        QtGui.QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
+        try:
+            self.overlay.apply(colors)
+        finally:
+            QtGui.QApplication.restoreOverrideCursor()
+        self.form.buttonRestoreColors.setEnabled(True)
+
+    def on_restore_colors(self):
+
+        "Restores the original colors of the objects colored by on_colorize(). Returns nothing"
+
+        if self.overlay.originals:
+            self.overlay.restore()
+        self.form.buttonRestoreColors.setEnabled(False)
+
+    def select_objects(self,objects):
+
+        "Replaces the current selection with the given objects, if any. Returns nothing"
+
+        if objects:
             FreeCADGui.Selection.clearSelection()
-            for obj in tosel:
+            for obj in objects:
                 FreeCADGui.Selection.addSelection(obj)
 
+    def on_search(self,text=None):
+
+        "Filters the results tree to show only items matching the search text. Returns nothing"
+
+        if not self.form.tableResults.isHidden():
+            if self.form.tableResults.model():
+                self.form.tableResults.model().set_filter(self.form.lineEditSearch.text())
+            return
+        if not self.result_index:
+            return
+        matches = self.result_index.search(self.form.lineEditSearch.text())
+        if matches is None:
+            visible = None
+        else:
+            visible = self.result_index.get_visible(matches)
+        # only touch the items whose visibility changes
+        if self.visible_nodes is None:
+            if visible is None:
+                return
+            changed = set(range(len(self.result_items))) - visible
+        elif visible is None:
+            changed = set(range(len(self.result_items))) - self.visible_nodes
+        else:
+            changed = visible ^ self.visible_nodes
+        self.form.treeResults.setUpdatesEnabled(False)
+        for node in changed:
+            self.result_items[node].setHidden((visible is not None) and (node not in visible))
+        self.form.treeResults.setUpdatesEnabled(True)
+        self.visible_nodes = visible
+
+    def on_table_changed(self,index):
+
+        "Shows the results tree (index 0) or the given table of the results. Returns nothing"
+
+        self.form.comboGroupBy.blockSignals(True)
+        self.form.comboGroupBy.clear()
+        self.form.comboGroupBy.addItem(translate("BIMBots","No grouping"))
+        if (index > 0) and (index <= len(self.result_tables)):
+            table = self.result_tables[index-1][1]
+            for column in table.columns:
+                self.form.comboGroupBy.addItem(translate("BIMBots","Count by")+" "+tostr(column))
+            self.form.comboGroupBy.blockSignals(False)
+            self.form.treeResults.hide()
+            self.form.tableResults.show()
+            self.form.comboGroupBy.show()
+            self.form.tableResults.setModel(get_table_model(table))
+            self.form.tableResults.horizontalHeader().setSortIndicator(-1,QtCore.Qt.AscendingOrder)
+            self.on_search()
+        else:
+            self.form.comboGroupBy.blockSignals(False)
+            self.form.tableResults.hide()
+            self.form.comboGroupBy.hide()
+            self.form.treeResults.show()
+            self.on_search()
+
+    def on_group_changed(self,index):
+
+        "Shows the current table grouped by the given column (index-1), or ungrouped if index is 0. Returns nothing"
+
+        tableindex = self.form.comboTables.currentIndex()
+        if (tableindex > 0) and (tableindex <= len(self.result_tables)):
+            table = self.result_tables[tableindex-1][1]
+            if index > 0:
+                rows = table.filter_rows(self.form.lineEditSearch.text())
+                self.form.tableResults.setModel(get_table_model(table.group_counts(index-1,rows)))
+            else:
+                self.form.tableResults.setModel(get_table_model(table))
+                self.on_search()
+
+    def on_click_table(self,index):
+
+        "Selects the document objects linked to a double-clicked table cell (guid, name or type columns). Returns nothing"
+
+        model = self.form.tableResults.model()
+        if model and index.isValid():
+            column = tostr(model.table.columns[index.column()]).lower()
+            value = model.table.get_value(model.view[index.row()],index.column())
+            if value is not None:
+                if column == "guid":
+                    self.select_objects(self.find_objects(uuids=[tostr(value)]))
+                elif column in ["name","type"]:
+                    self.select_objects(self.find_objects(**{column+"s":[tostr(value)]}))
+
+    def on_search_select(self):
+
+        "Selects the document objects linked to the items matching the search text. Returns nothing"
+
+        if self.result_index:
+            matches = self.result_index.search(self.form.lineEditSearch.text())
+            if matches:
+                links = self.result_index.get_links(matches)
+                self.select_objects(self.find_objects(links["uuid"],links["name"],links["type"]))
+
     def save_ifc(self,objectslist):
 
-        "Saves an IFC file with the given objects to a temporary location. Returns the file path."
+        "Saves an IFC file with the given objects to a temporary location, or reuses a previous export. Returns the file path."
 
-        tf = tempfile.mkstemp(suffix=".ifc")[1]
-        print("Saving temporary IFC file at",tf)
-        import importIFC
-        importIFC.export(objectslist,tf)
-        return tf
+        return export_ifc(objectslist)
+
+    def get_scope_objects(self,scope=None):
+
+        "Returns the list of document objects for the given scope text (defaults to the selected scope). Other scopes give all document objects"
+
+        if scope is None:
+            scopeitem = self.form.scopeList.currentItem()
+            scope = scopeitem.text() if scopeitem else None
+        if not FreeCAD.ActiveDocument:
+            return []
+        if scope == translate("BIMBots","Selected objects"):
+            return FreeCADGui.Selection.getSelection()
+        elif scope == translate("BIMBots","All visible objects"):
+            return [o for o in FreeCAD.ActiveDocument.Objects if o.ViewObject and hasattr(o.ViewObject,"Visibility") and o.ViewObject.Visibility]
+        return FreeCAD.ActiveDocument.Objects
+
+    def get_speculative_objects(self):
+
+        "Returns the objects the background export should prepare: those of the selected scope, or all visible objects. Returns a list"
+
+        scopeitem = self.form.scopeList.currentItem()
+        if scopeitem and (scopeitem.text() in [translate("BIMBots","All document objects"),translate("BIMBots","All visible objects")]):
+            return self.get_scope_objects(scopeitem.text())
+        return self.get_scope_objects(translate("BIMBots","All visible objects"))
+
+    def on_speculative(self,state=None):
+
+        "Starts or stops the background export according to the Prepare in background checkbox. Returns nothing"
+
+        if self.form.checkSpeculative.isChecked():
+            self.speculative.start()
+        else:
+            self.speculative.stop()
 
     def on_cancel(self):
 
-        "Cancels the current operation by setting the running flag to False. Returns nothing"
+        "Cancels the current operation by setting the running flag to False, and the job started by on_run if any. Returns nothing"
 
         self.running = False
+        if self.job:
+            get_job_queue().cancel(self.job[0])
+            self.job = None
+            self.form.groupProgress.hide()
 
     def get_defaults(self):
 
@@ -1015,6 +4489,7 @@ class bimbots_panel:
         settings = FreeCAD.ParamGet("User parameter:Plugins/BIMbots")
         self.form.checkAutoDiscover.setChecked(settings.GetBool("checkAutoDiscover",True))
         self.form.checkShowUnreachable.setChecked(settings.GetBool("checkShowUnreachable",True))
+        self.form.checkSpeculative.setChecked(settings.GetBool("checkSpeculative",False))
 
     def save_defaults(self,arg=None):
 
@@ -1023,6 +4498,7 @@ class bimbots_panel:
         settings = FreeCAD.ParamGet("User parameter:Plugins/BIMbots")
         settings.SetBool("checkAutoDiscover",self.form.checkAutoDiscover.isChecked())
         settings.SetBool("checkShowUnreachable",self.form.checkShowUnreachable.isChecked())
+        settings.SetBool("checkSpeculative",self.form.checkSpeculative.isChecked())
 
 
 
@@ -1030,4 +4506,19 @@ class bimbots_panel:
 
 
 if __name__ == "__main__":
-    print_services()
+    if sys.argv[1:2] == ["--cache-server"]:
+        # bimbots.py --cache-server [--host address] [--anonymous] [directory] [port] [tokens file]
+        args = sys.argv[2:]
+        host = "127.0.0.1"
+        if "--host" in args[:-1]:
+            host = args.pop(args.index("--host")+1)
+            args.remove("--host")
+        anonymous = "--anonymous" in args
+        if anonymous:
+            args.remove("--anonymous")
+        serve_shared_cache(args[0] if args else os.path.join(os.path.expanduser("~"),"BIMbots-cache"),
+                           int(args[1]) if len(args) > 1 else 8090,
+                           args[2] if len(args) > 2 else None,
+                           host,anonymous)
+    else:
+        print_services()
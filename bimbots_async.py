@@ -0,0 +1,496 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2019 Yorik van Havre <yorik@uncreated.net>              *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+# Homepage: https://github.com/opensourceBIM/BIMbots-FreeCAD
+# That repo contains useful implementation notes too
+
+"""An asyncio client for BIMbots services (Python 3 only). It offers the same operations as the
+functions of the bimbots module, as coroutines that return typed records and raise exceptions
+instead of returning empty values. All requests go through a pool of keep-alive HTTP connections,
+so a single process can drive many concurrent runs without threads. Configuration, authentication
+tokens and the results history are shared with the bimbots module.
+
+    import asyncio, bimbots_async
+    async def main():
+        async with bimbots_async.async_client() as client:
+            providers = await client.get_service_providers()
+            services = await client.get_services(providers[0].list_url)
+    asyncio.run(main())
+"""
+
+import os
+import ssl
+import json
+import time
+import asyncio
+from urllib.parse import urlsplit, urlencode
+
+import bimbots
+
+
+#############   Exceptions
+
+
+class bimbots_error(Exception):
+
+    "Base class of all the errors raised by the async client"
+
+
+class connection_error(bimbots_error):
+
+    "The server could not be reached, or didn't answer in time"
+
+
+class http_error(bimbots_error):
+
+    "The server answered with an error status"
+
+    def __init__(self,url,status,body=b""):
+
+        bimbots_error.__init__(self,"HTTP error "+str(status)+" from "+url)
+        self.url = url
+        self.status = status
+        self.body = body
+
+
+class response_error(bimbots_error):
+
+    "The server answer could not be understood"
+
+
+class authentication_error(bimbots_error):
+
+    "The service has not been authenticated yet (see bimbots.save_authentication())"
+
+
+class rejected_error(bimbots_error):
+
+    "The service rejected the payload"
+
+    def __init__(self,code,message):
+
+        bimbots_error.__init__(self,"Error code "+str(code)+": "+str(message))
+        self.code = code
+        self.message = message
+
+
+#############   Blocking calls
+
+
+async def run_blocking(function,*args):
+
+    """Runs a blocking function of the bimbots module (config file, history database, shared cache)
+    in the default executor, so the event loop is never held. Returns the function result"""
+
+    return await asyncio.get_running_loop().run_in_executor(None,function,*args)
+
+
+def read_settings():
+
+    "Returns a dict of the config values used by the async client, read from the config file once"
+
+    names = ["client_name","client_description","client_icon","client_url","default_services_url"]
+    return dict([(name,bimbots.get_config_value(name)) for name in names])
+
+
+def read_file(path):
+
+    "Returns the contents of the given text file"
+
+    with open(path) as file_stream:
+        return file_stream.read()
+
+
+#############   Results
+
+
+class payload_result(object):
+
+    "The outcome of sending a payload to a service"
+
+    __slots__ = ["results","result_type","context_id","duration","run_id"]
+
+    def __init__(self,results,result_type,context_id=None,duration=None,run_id=None):
+
+        self.results = results # a dict for json results, bytes otherwise
+        self.result_type = result_type # json, bcf or text
+        self.context_id = context_id # the Context-Id returned by the server, if any
+        self.duration = duration # seconds spent waiting for the service
+        self.run_id = run_id # the id of this run in the history, if stored
+
+
+#############   HTTP transport
+
+
+class http_response(object):
+
+    "A response received by http_pool"
+
+    __slots__ = ["status","headers","body"]
+
+    def __init__(self,status,headers,body):
+
+        self.status = status
+        self.headers = headers # lowercase header name: value
+        self.body = body
+
+    @property
+    def ok(self):
+
+        return self.status < 400
+
+    def json(self):
+
+        return json.loads(self.body.decode("utf8"))
+
+
+class http_pool:
+
+    """A minimal HTTP/1.1 client keeping idle keep-alive connections per host for reuse, and
+    limiting the number of simultaneous connections to each host"""
+
+    def __init__(self,max_connections=10,user_agent=None):
+
+        self.max_connections = max_connections
+        self.user_agent = user_agent or bimbots.CLIENT_NAME
+        self.idle = {} # (scheme, host, port): list of (reader, writer)
+        self.limits = {} # (scheme, host, port): asyncio.Semaphore
+        self.ssl_context = None
+
+    async def request(self,method,url,headers=None,body=None,timeout=None):
+
+        """Sends a request and returns a http_response. The timeout is a number of seconds, or a (connect, read)
+        tuple. Raises connection_error if the server can't be reached in time"""
+
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        key = (parts.scheme,parts.hostname,port)
+        if key not in self.limits:
+            self.limits[key] = asyncio.Semaphore(self.max_connections)
+        target = (parts.path or "/") + ("?"+parts.query if parts.query else "")
+        if isinstance(body,str):
+            body = body.encode("utf8")
+        lines = [method+" "+target+" HTTP/1.1","Host: "+parts.netloc,"Connection: keep-alive",
+                 "User-Agent: "+str(self.user_agent)]
+        for name, value in (headers or {}).items():
+            lines.append(name+": "+str(value))
+        lines.append("Content-Length: "+str(len(body or b"")))
+        request = ("\r\n".join(lines)+"\r\n\r\n").encode("latin-1") + (body or b"")
+        if isinstance(timeout,(tuple,list)):
+            connect_timeout, timeout = timeout[0], sum(timeout)
+        else:
+            connect_timeout = timeout
+        async with self.limits[key]:
+            try:
+                return await asyncio.wait_for(self.exchange(key,request,method,connect_timeout),timeout)
+            except asyncio.TimeoutError:
+                raise connection_error("Timeout while waiting for "+url)
+            except (OSError,asyncio.IncompleteReadError,ValueError) as e:
+                raise connection_error("Unable to connect to "+url+": "+str(e))
+
+    async def exchange(self,key,request,method,connect_timeout=None):
+
+        "Sends the request on an idle or new connection and reads the response. Returns a http_response"
+
+        connections = self.idle.setdefault(key,[])
+        while connections:
+            reader, writer = connections.pop()
+            if reader.at_eof():
+                writer.close()
+                continue
+            try:
+                response = await self.send(reader,writer,request,method)
+            except (OSError,asyncio.IncompleteReadError,ValueError):
+                # the server closed this idle connection, try another one
+                continue
+            self.release(key,reader,writer,response)
+            return response
+        reader, writer = await asyncio.wait_for(self.connect(key),connect_timeout)
+        response = await self.send(reader,writer,request,method)
+        self.release(key,reader,writer,response)
+        return response
+
+    async def send(self,reader,writer,request,method):
+
+        """Writes the request on the given connection and reads the response. Closes the connection
+        if anything fails, including a cancellation by asyncio.wait_for(). Returns a http_response"""
+
+        try:
+            writer.write(request)
+            await writer.drain()
+            return await self.read_response(reader,method)
+        except BaseException:
+            # the connection is in an unknown state and can't go back to the pool
+            writer.close()
+            raise
+
+    async def connect(self,key):
+
+        "Opens a new connection to the given (scheme, host, port). Returns (reader, writer)"
+
+        scheme, host, port = key
+        context = None
+        if scheme == "https":
+            if self.ssl_context is None:
+                self.ssl_context = ssl.create_default_context()
+            context = self.ssl_context
+        return await asyncio.open_connection(host,port,ssl=context)
+
+    def release(self,key,reader,writer,response):
+
+        "Keeps the connection for reuse, unless the server asked to close it. Returns nothing"
+
+        if response.headers.get("connection","").lower() == "close":
+            writer.close()
+        else:
+            self.idle[key].append((reader,writer))
+
+    async def read_response(self,reader,method):
+
+        "Reads a response (status line, headers and body) from the given reader. Returns a http_response"
+
+        status_line = await reader.readuntil(b"\r\n")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, value = line.decode("latin-1").split(":",1)
+            headers[name.strip().lower()] = value.strip()
+        body = b""
+        if (method == "HEAD") or (status in (204,304)) or (100 <= status < 200):
+            pass
+        elif headers.get("transfer-encoding","").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0],16)
+                if size == 0:
+                    # skip trailers
+                    while (await reader.readuntil(b"\r\n")) != b"\r\n":
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            body = b"".join(chunks)
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        else:
+            # the body ends when the server closes the connection
+            body = await reader.read()
+            headers["connection"] = "close"
+        return http_response(status,headers,body)
+
+    async def close(self):
+
+        "Closes all idle connections. Returns nothing"
+
+        for connections in self.idle.values():
+            for reader, writer in connections:
+                writer.close()
+        self.idle = {}
+
+
+#############   Client
+
+
+class async_client:
+
+    """An asyncio BIMbots client. Use it as an async context manager, or call close() when done.
+    Unless a timeout is given, timeouts are adapted to each service (see bimbots.get_timeout())."""
+
+    def __init__(self,max_connections=10,timeout=None):
+
+        self.pool = http_pool(max_connections)
+        self.timeout = timeout
+        self.settings = None
+
+    async def __aenter__(self):
+
+        await self.get_settings()
+        return self
+
+    async def get_settings(self):
+
+        "Returns the config values used by this client (see read_settings()), reading them on first use"
+
+        if self.settings is None:
+            self.settings = await run_blocking(read_settings)
+            self.pool.user_agent = self.settings['client_name'] or self.pool.user_agent
+        return self.settings
+
+    async def __aexit__(self,*args):
+
+        await self.close()
+
+    async def close(self):
+
+        "Closes the pooled connections. Returns nothing"
+
+        await self.pool.close()
+
+    async def request(self,method,url,headers=None,body=None,timeout=None):
+
+        "Sends a request through the pool, and stores its duration in the history (see bimbots.send_request()). Returns a http_response"
+
+        size = len(body or b"")
+        timeout = timeout or self.timeout or await run_blocking(bimbots.get_timeout,url,size)
+        await self.get_settings()
+        concurrency = bimbots.begin_request(url)
+        start = time.time()
+        ok = False
+        try:
+            response = await self.pool.request(method,url,headers,body,timeout)
+            ok = response.status < 500
+            return response
+        finally:
+            bimbots.end_request(url)
+            await run_blocking(bimbots.record_timing,url,time.time()-start,size,ok,concurrency)
+
+    async def get_json(self,method,url,**kwargs):
+
+        "Sends a request and returns its json contents. Raises http_error or response_error"
+
+        response = await self.request(method,url,**kwargs)
+        if not response.ok:
+            raise http_error(url,response.status,response.body)
+        try:
+            return response.json()
+        except ValueError:
+            raise response_error("Unable to read json data from "+url)
+
+    async def get_service_providers(self,autodiscover=True,url=None):
+
+        """Returns a list of provider_record from the config file and, if autodiscover is True, from the
+        given service list url (or from the default one). An unreachable list only raises if there are no custom providers"""
+
+        providers = await run_blocking(bimbots.get_custom_providers)
+        if autodiscover:
+            settings = await self.get_settings()
+            url = url or settings['default_services_url'] or bimbots.SERVICES_URL
+            try:
+                data = await self.get_json("GET",url)
+                defaults = data['active']
+            except (bimbots_error,KeyError,TypeError):
+                if not providers:
+                    raise
+                defaults = []
+            known = set([p['listUrl'] for p in providers])
+            providers.extend([d for d in defaults if d['listUrl'] not in known])
+        return [bimbots.provider_record(p) for p in providers]
+
+    async def get_services(self,list_url):
+
+        "Returns a list of service_record offered by the given provider. Adds /servicelist to the url if needed"
+
+        try:
+            data = await self.get_json("GET",list_url)
+            services = data['services']
+        except (response_error,http_error,KeyError,TypeError):
+            if list_url.endswith("servicelist"):
+                raise response_error("Unable to read services list from "+list_url)
+            return await self.get_services(list_url.rstrip("/")+"/servicelist")
+        records = [bimbots.service_record(list_url,s) for s in services]
+        config = await run_blocking(bimbots.read_config)
+        authenticated = set([(s['provider_url'],s['id']) for s in config.get('services',[]) if 'token' in s])
+        for record in records:
+            record.authenticated = record.key in authenticated
+        return records
+
+    async def authenticate_step_1(self,register_url):
+
+        "Sends an authentication request to the given server. Returns the result json as a dict"
+
+        settings = await self.get_settings()
+        data = {
+            "redirect_url": "SHOW_CODE",
+            "client_name": settings['client_name'],
+            "client_description": settings['client_description'],
+            "client_icon": settings['client_icon'],
+            "client_url": settings['client_url'],
+            "type": "pull"
+        }
+        return await self.get_json("POST",register_url,headers={"Content-Type":"application/json"},body=json.dumps(data))
+
+    def get_authorization_url(self,authorization_url,client_id,service_name):
+
+        "Returns the URL the user must open in a web browser to finish authentication (see bimbots.authenticate_step_2())"
+
+        data = {
+            "auth_type": "service",
+            "client_id": client_id,
+            "response_type": "code",
+            "redirect_uri": "SHOW_CODE",
+            "state": "{ \"_serviceName\" : \"" + service_name + "\" }"
+        }
+        return authorization_url + "?" + urlencode(data)
+
+    async def send_ifc_payload(self,provider_url,service_id,file_path=None,data=None,context_id=None,timeout=None):
+
+        """Sends the given IFC file (or IFC data) to the given service, unless its results are found in the
+        shared cache (see bimbots.get_shared_results()). Returns a payload_result. Raises authentication_error, connection_error, http_error or rejected_error"""
+
+        service = await run_blocking(bimbots.get_service_config,provider_url,service_id)
+        if not service:
+            raise authentication_error("No authentication token found for service "+str(service_id)+" of "+provider_url)
+        if data is None:
+            if not (file_path and os.path.exists(file_path)):
+                raise bimbots_error("Unable to load payload IFC file from "+str(file_path))
+            data = await run_blocking(read_file,file_path)
+        headers = {
+            "Input-Type": "IFC_STEP_2X3TC1",
+            "Token": service['token'],
+            "Accept-Flow": "SYNC,ASYNC_WS"
+        }
+        if context_id:
+            headers['Context-Id'] = context_id
+        cached = await run_blocking(bimbots.get_shared_results,provider_url,service_id,data)
+        if cached:
+            run_id = await run_blocking(bimbots.record_run,provider_url,service_id,data,cached)
+            return payload_result(cached,bimbots.get_result_type(cached),None,0.0,run_id)
+        start = time.time()
+        if isinstance(data,str):
+            data = data.encode("utf8")
+        response = await self.request("POST",service['service_url'],headers,data,timeout)
+        duration = time.time() - start
+        if not response.ok:
+            raise http_error(service['service_url'],response.status,response.body)
+        try:
+            results = response.json()
+        except ValueError:
+            results = response.body
+        else:
+            if isinstance(results,dict) and ("message" in results) and ("error" in str(results['message']).lower()) and ("code" in results):
+                raise rejected_error(results['code'],results['message'])
+        await run_blocking(bimbots.store_shared_results,provider_url,service_id,data,results)
+        run_id = await run_blocking(bimbots.record_run,provider_url,service_id,data,results,duration)
+        return payload_result(results,bimbots.get_result_type(results),response.headers.get("context-id"),duration,run_id)
+
+    async def send_test_payload(self,provider_url,service_id):
+
+        "Sends the test IFC file to the given service. Returns a payload_result"
+
+        payload_file = os.path.join(os.path.dirname(os.path.abspath(bimbots.__file__)),"testfiles","test payload.ifc")
+        return await self.send_ifc_payload(provider_url,service_id,payload_file)
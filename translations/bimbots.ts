@@ -1,132 +1,193 @@
 <?xml version="1.0" encoding="utf-8"?>
-<!DOCTYPE TS><TS version="2.0">
+<!DOCTYPE TS>
+<TS version="2.1">
 <context>
     <name>BIMBots</name>
     <message>
-        <location filename="../bimbots.py" line="616"/>
+        <location filename="../bimbots.py" line="3774"/>
         <source>Getting services</source>
         <translation type="unfinished"></translation>
     </message>
     <message>
-        <location filename="../bimbots.py" line="633"/>
+        <location filename="../bimbots.py" line="3841"/>
         <source>saved</source>
         <translation type="unfinished"></translation>
     </message>
     <message>
-        <location filename="../bimbots.py" line="635"/>
+        <location filename="../bimbots.py" line="3843"/>
         <source>autodiscovered</source>
         <translation type="unfinished"></translation>
     </message>
     <message>
-        <location filename="../bimbots.py" line="833"/>
+        <location filename="../bimbots.py" line="3865"/>
         <source>Authenticated</source>
         <translation type="unfinished"></translation>
     </message>
     <message>
-        <location filename="../bimbots.py" line="668"/>
+        <location filename="../bimbots.py" line="3879"/>
         <source>Unreachable</source>
         <translation type="unfinished"></translation>
     </message>
     <message>
-        <location filename="../bimbots.py" line="692"/>
+        <location filename="../bimbots.py" line="3912"/>
         <source>Test output only</source>
         <translation type="unfinished"></translation>
     </message>
     <message>
-        <location filename="../bimbots.py" line="758"/>
+        <location filename="../bimbots.py" line="3980"/>
         <source>Removal warning</source>
         <translation type="unfinished"></translation>
     </message>
     <message>
-        <location filename="../bimbots.py" line="758"/>
+        <location filename="../bimbots.py" line="3980"/>
         <source>Remove provider</source>
         <translation type="unfinished"></translation>
     </message>
     <message>
-        <location filename="../bimbots.py" line="758"/>
+        <location filename="../bimbots.py" line="3980"/>
         <source>This cannot be undone.</source>
         <translation type="unfinished"></translation>
     </message>
     <message>
-        <location filename="../bimbots.py" line="789"/>
+        <location filename="../bimbots.py" line="4006"/>
         <source>Unable to open a web browser. Please paste the following URL in your web browser</source>
         <translation type="unfinished"></translation>
     </message>
     <message>
-        <location filename="../bimbots.py" line="839"/>
+        <location filename="../bimbots.py" line="4047"/>
         <source>Preparing</source>
         <translation type="unfinished"></translation>
     </message>
     <message>
-        <location filename="../bimbots.py" line="845"/>
+        <location filename="../bimbots.py" line="4050"/>
         <source>Test payload</source>
         <translation type="unfinished"></translation>
     </message>
     <message>
-        <location filename="../bimbots.py" line="872"/>
+        <location filename="../bimbots.py" line="4094"/>
         <source>Sending data</source>
         <translation type="unfinished"></translation>
     </message>
     <message>
-        <location filename="../bimbots.py" line="850"/>
+        <location filename="../bimbots.py" line="4053"/>
         <source>Choose IFC file</source>
         <translation type="unfinished"></translation>
     </message>
     <message>
-        <location filename="../bimbots.py" line="851"/>
+        <location filename="../bimbots.py" line="4054"/>
         <source>Choose an existing IFC file</source>
         <translation type="unfinished"></translation>
     </message>
     <message>
-        <location filename="../bimbots.py" line="851"/>
+        <location filename="../bimbots.py" line="4054"/>
         <source>IFC files (*.ifc)</source>
         <translation type="unfinished"></translation>
     </message>
     <message>
-        <location filename="../bimbots.py" line="861"/>
+        <location filename="../bimbots.py" line="4059"/>
         <source>Saving IFC file</source>
         <translation type="unfinished"></translation>
     </message>
     <message>
-        <location filename="../bimbots.py" line="863"/>
+        <location filename="../bimbots.py" line="4409"/>
         <source>Selected objects</source>
         <translation type="unfinished"></translation>
     </message>
     <message>
-        <location filename="../bimbots.py" line="865"/>
+        <location filename="../bimbots.py" line="4422"/>
         <source>All visible objects</source>
         <translation type="unfinished"></translation>
     </message>
     <message>
-        <location filename="../bimbots.py" line="898"/>
+        <location filename="../bimbots.py" line="4140"/>
         <source>BCF results saved as:</source>
         <translation type="unfinished"></translation>
     </message>
     <message>
-        <location filename="../bimbots.py" line="898"/>
+        <location filename="../bimbots.py" line="4140"/>
         <source>BCF viewing is not yet implemented.</source>
         <translation type="unfinished"></translation>
     </message>
     <message>
-        <location filename="../bimbots.py" line="900"/>
+        <location filename="../bimbots.py" line="4142"/>
         <source>Results</source>
         <translation type="unfinished"></translation>
     </message>
     <message>
-        <location filename="../bimbots.py" line="906"/>
+        <location filename="../bimbots.py" line="4152"/>
         <source>Error: No results obtained</source>
         <translation type="unfinished"></translation>
     </message>
     <message>
-        <location filename="../bimbots.py" line="907"/>
+        <location filename="../bimbots.py" line="4153"/>
         <source>Empty response</source>
         <translation type="unfinished"></translation>
     </message>
     <message>
-        <location filename="../bimbots.py" line="907"/>
+        <location filename="../bimbots.py" line="4153"/>
         <source>The server didn&apos;t send a valid response. There can be many reasons to this, but the most likely is that the IFC file generated from your model wasn&apos;t accepted by the server. Try working with only a couple of selected objects first, to see if the service is responding correctly.</source>
         <translation type="unfinished"></translation>
     </message>
+    <message>
+        <location filename="../bimbots.py" line="3862"/>
+        <source>Also available from</source>
+        <translation type="unfinished"></translation>
+    </message>
+    <message>
+        <location filename="../bimbots.py" line="4083"/>
+        <source>Jobs</source>
+        <translation type="unfinished"></translation>
+    </message>
+    <message>
+        <location filename="../bimbots.py" line="4083"/>
+        <source>running</source>
+        <translation type="unfinished"></translation>
+    </message>
+    <message>
+        <location filename="../bimbots.py" line="4083"/>
+        <source>pending</source>
+        <translation type="unfinished"></translation>
+    </message>
+    <message>
+        <location filename="../bimbots.py" line="4094"/>
+        <source>Waiting in queue</source>
+        <translation type="unfinished"></translation>
+    </message>
+    <message>
+        <location filename="../bimbots.py" line="4127"/>
+        <source>Tree view</source>
+        <translation type="unfinished"></translation>
+    </message>
+    <message>
+        <location filename="../bimbots.py" line="4253"/>
+        <source>No findings</source>
+        <translation type="unfinished"></translation>
+    </message>
+    <message>
+        <location filename="../bimbots.py" line="4253"/>
+        <source>No service has found anything about the selected objects yet. Run a service on a model containing them first.</source>
+        <translation type="unfinished"></translation>
+    </message>
+    <message>
+        <location filename="../bimbots.py" line="4264"/>
+        <source>These results don&apos;t reference any object</source>
+        <translation type="unfinished"></translation>
+    </message>
+    <message>
+        <location filename="../bimbots.py" line="4334"/>
+        <source>No grouping</source>
+        <translation type="unfinished"></translation>
+    </message>
+    <message>
+        <location filename="../bimbots.py" line="4338"/>
+        <source>Count by</source>
+        <translation type="unfinished"></translation>
+    </message>
+    <message>
+        <location filename="../bimbots.py" line="4420"/>
+        <source>All document objects</source>
+        <translation type="unfinished"></translation>
+    </message>
 </context>
 <context>
     <name>Form</name>
@@ -376,39 +437,114 @@
         <translation type="unfinished"></translation>
     </message>
     <message>
-        <location filename="../bimbots.ui" line="509"/>
+        <location filename="../bimbots.ui" line="529"/>
         <source>&lt;html&gt;&lt;head/&gt;&lt;body&gt;&lt;p&gt;Runs the selected service and displays the results&lt;/p&gt;&lt;p&gt;&lt;br/&gt;&lt;/p&gt;&lt;p&gt;If unable to obtain a response, you might need to add deserializers to your account under &amp;quot;User Settings&amp;quot; in the BIMServer panel &lt;/p&gt;&lt;/body&gt;&lt;/html&gt;</source>
         <translation type="unfinished"></translation>
     </message>
     <message>
-        <location filename="../bimbots.ui" line="512"/>
+        <location filename="../bimbots.ui" line="532"/>
         <source>Run service</source>
         <translation type="unfinished"></translation>
     </message>
     <message>
-        <location filename="../bimbots.ui" line="527"/>
+        <location filename="../bimbots.ui" line="562"/>
         <source>Results</source>
         <translation type="unfinished"></translation>
     </message>
     <message>
-        <location filename="../bimbots.ui" line="560"/>
+        <location filename="../bimbots.ui" line="633"/>
         <source>value</source>
         <translation type="unfinished"></translation>
     </message>
     <message>
-        <location filename="../bimbots.ui" line="568"/>
+        <location filename="../bimbots.ui" line="681"/>
         <source>Closes the results screen and re-shows the service options</source>
         <translation type="unfinished"></translation>
     </message>
     <message>
-        <location filename="../bimbots.ui" line="571"/>
+        <location filename="../bimbots.ui" line="684"/>
         <source>Run other service</source>
         <translation type="unfinished"></translation>
     </message>
     <message>
-        <location filename="../bimbots.ui" line="586"/>
+        <location filename="../bimbots.ui" line="699"/>
         <source>&lt;html&gt;&lt;head/&gt;&lt;body&gt;&lt;p&gt;&lt;a href=&quot;https://github.com/opensourceBIM/BIMbots-FreeCAD/blob/master/doc/ui-documentation.md&quot;&gt;&lt;span&gt;BIMbots plugin documentation&lt;/span&gt;&lt;/a&gt;&lt;/p&gt;&lt;/body&gt;&lt;/html&gt;</source>
         <translation type="unfinished"></translation>
     </message>
+    <message>
+        <location filename="../bimbots.ui" line="506"/>
+        <source>Runs are queued and survive a restart of FreeCAD. Their results are stored in the history</source>
+        <translation type="unfinished"></translation>
+    </message>
+    <message>
+        <location filename="../bimbots.ui" line="516"/>
+        <source>&lt;html&gt;&lt;head/&gt;&lt;body&gt;&lt;p&gt;When the document stays unchanged for a few seconds, exports the objects of the selected scope (or all visible objects) in the background, so running a service doesn&apos;t have to wait for the export&lt;/p&gt;&lt;/body&gt;&lt;/html&gt;</source>
+        <translation type="unfinished"></translation>
+    </message>
+    <message>
+        <location filename="../bimbots.ui" line="519"/>
+        <source>Prepare export in background</source>
+        <translation type="unfinished"></translation>
+    </message>
+    <message>
+        <location filename="../bimbots.ui" line="544"/>
+        <source>&lt;html&gt;&lt;head/&gt;&lt;body&gt;&lt;p&gt;Shows everything the services found about the selected objects, in their latest runs on the model&lt;/p&gt;&lt;/body&gt;&lt;/html&gt;</source>
+        <translation type="unfinished"></translation>
+    </message>
+    <message>
+        <location filename="../bimbots.ui" line="547"/>
+        <source>Show findings for selection</source>
+        <translation type="unfinished"></translation>
+    </message>
+    <message>
+        <location filename="../bimbots.ui" line="568"/>
+        <source>Type words to filter the results. Press Enter to select the corresponding objects in the document</source>
+        <translation type="unfinished"></translation>
+    </message>
+    <message>
+        <location filename="../bimbots.ui" line="571"/>
+        <source>Search results</source>
+        <translation type="unfinished"></translation>
+    </message>
+    <message>
+        <location filename="../bimbots.ui" line="580"/>
+        <source>Shows the whole results as a tree, or one of the lists they contain as a table</source>
+        <translation type="unfinished"></translation>
+    </message>
+    <message>
+        <location filename="../bimbots.ui" line="584"/>
+        <source>Tree view</source>
+        <translation type="unfinished"></translation>
+    </message>
+    <message>
+        <location filename="../bimbots.ui" line="592"/>
+        <source>Counts the rows of the table for each value of the chosen column</source>
+        <translation type="unfinished"></translation>
+    </message>
+    <message>
+        <location filename="../bimbots.ui" line="596"/>
+        <source>No grouping</source>
+        <translation type="unfinished"></translation>
+    </message>
+    <message>
+        <location filename="../bimbots.ui" line="656"/>
+        <source>Colors the objects of the model according to these results: green objects have no finding, the others go from yellow to red with the number or severity of their findings</source>
+        <translation type="unfinished"></translation>
+    </message>
+    <message>
+        <location filename="../bimbots.ui" line="659"/>
+        <source>Color model</source>
+        <translation type="unfinished"></translation>
+    </message>
+    <message>
+        <location filename="../bimbots.ui" line="669"/>
+        <source>Restores the original colors of the objects</source>
+        <translation type="unfinished"></translation>
+    </message>
+    <message>
+        <location filename="../bimbots.ui" line="672"/>
+        <source>Restore colors</source>
+        <translation type="unfinished"></translation>
+    </message>
 </context>
 </TS>